@@ -4,30 +4,55 @@ from anytree import Node, RenderTree
 from cachetools import LRUCache
 from collections import defaultdict
 from concurrent.futures import (
+    Executor,
+    Future,
     ProcessPoolExecutor,
     ThreadPoolExecutor,
     as_completed,
 )
+from ead_html_validator import Checkpoint, CheckpointMismatchError
 from ead_html_validator import Component
+from ead_html_validator import ComponentNotFoundError
 from ead_html_validator import EADHTML
 from ead_html_validator import Ead
 from ead_html_validator import Errors
 from ead_html_validator import RequestMaterials
 from ead_html_validator import ResultSet
+from ead_html_validator import archive
 from ead_html_validator import util
+from ead_html_validator.checkpoint import COMPONENT, TOP_LEVEL
+from ead_html_validator.handles import HandleResolver, set_resolver
+from ead_html_validator.incremental import IncrementalCache, hash_fragment
+from ead_html_validator.inventory import Inventory
+from ead_html_validator.links import LinkChecker, harvest_links, is_broken
+from ead_html_validator.manifest import Manifest
+from ead_html_validator.permalinks import PermalinkIndex, set_index
+from ead_html_validator.phases import PhaseGraph
+from ead_html_validator.pool import TaskPool, cancel_pending, recycle_reason
+from ead_html_validator.prefetch import Prefetcher
+from ead_html_validator.records import RecordStore
+from ead_html_validator.resources import affinity_cpus, pin_cpus, plan_workers
+from ead_html_validator.reporter import Reporter, StreamRenderer
+from ead_html_validator.results import read_results
+from ead_html_validator.snapshot import SnapshotStore
+from ead_html_validator.snapshot import LEVEL, NOT_FOUND, SUB_COMPONENTS
+from ead_html_validator.structure import VerdictCache, check_files, has_errors
 from importlib import import_module
+from itertools import chain
 from lxml import etree as ET
-from multiprocessing import Manager, get_context
+from multiprocessing import get_context
 from pathlib import Path
 from pprint import pprint, pformat
 from subprocess import PIPE
 from tqdm import tqdm
-from typing import List
+from typing import List, Tuple
+from urllib.parse import urlsplit
 import argparse
 import difflib
 import functools
 import inflect
 import inspect
+import json
 import logging
 import os.path
 import pkg_resources
@@ -90,6 +115,19 @@ pass_color = {
     False: red,
 }
 
+# Largest amount of EAD text a worker process sends back with an error.
+# Longer values are sent as a digest and extracted again by the parent.
+INLINE_VALUE_LIMIT = 1024
+
+# Number of parsed HTML pages kept by each worker.
+EHTML_CACHE_SIZE = 10
+
+# Tasks submitted to the pool at a time, per worker.
+TASKS_PER_WORKER = 2
+
+# Markup of the pages needed by the chunk a worker is checking, read
+# ahead by the parent.
+prefetched = {}
 
 def stringify_list(mylist) -> List[str]:
     return [
@@ -218,39 +256,253 @@ def create_list(obj) -> list:
         return obj
 
 
-def validate_html(html_dir, args, tidyrc) -> None:
-    html_files = []
-    for root, dirs, files in os.walk(html_dir):
-        for file in files:
-            if re.search(r"(?<!tidy)\.html$", file):
-                html_files.append(os.path.join(root, file))
+def check_links(html_files, args, pool=None, jobs=1) -> None:
+    links = harvest_links(html_files, jobs=jobs, executor=pool)
+    logging.debug(
+        f"Found {len(links)} distinct links in {len(html_files)} HTML files"
+    )
+    urls = sorted(url for url in links if util.is_url(url))
+    logging.trace(f"Testing the following links: {pformat(urls)}")
+    checker = LinkChecker(
+        cache_file=util.cache_file(args.cache_dir, "links", "status"),
+        ttl=args.link_cache_ttl * 3600,
+        timeout=args.link_timeout,
+        host_limit=args.link_host_limit,
+        host_rate=args.link_host_rate,
+    )
+    try:
+        results = checker.check(urls)
+    finally:
+        checker.close()
+    broken_links = {
+        url: {
+            "status": result["error"] or result["status"],
+            "files": sorted(links[url]),
+        }
+        for url, result in results.items()
+        if is_broken(result)
+    }
+    logging.info(
+        f"Checked {len(urls)} links, {checker.hits} cached:"
+        f" {len(broken_links)} broken."
+    )
+    if broken_links:
+        logging.warning(
+            f"The following links are broken {pformat(broken_links)}"
+        )
+
+
+def indent_xml(ead_file, pretty_ead_file, indent_file) -> None:
+    if "pretty" in ead_file or (
+        os.path.isfile(pretty_ead_file)
+        and not isnewer(ead_file, pretty_ead_file)
+    ):
+        return
+    # Ead strips the namespaces from its tree, so indent the file as is.
+    result = load_stylesheet(indent_file)(archive.parse_xml(ead_file))
+    tmp_file = f"{pretty_ead_file}.{os.getpid()}.tmp"
+    with open(tmp_file, "wb") as fh:
+        fh.write(bytes(result))
+    os.replace(tmp_file, pretty_ead_file)
+    logging.debug(f"Indented {ead_file} to {pretty_ead_file}")
+
+
+@functools.lru_cache(maxsize=None)
+def load_stylesheet(xsl_file) -> ET.XSLT:
+    return ET.XSLT(ET.parse(xsl_file))
+
+
+def worker_budget(args) -> int:
+    num_cpus = affinity_cpus()
+    ishpc = "CLUSTER" in os.environ
+    isslurm = any(env.startswith("SLURM") for env in os.environ)
+    # hpc cluster reports large number of cpus which leads to a large
+    # number of processes which may get killed by the os for lack of
+    # resources. Limit to 2 except when running under slurm or when
+    # worker memory is capped with --max-worker-rss.
+    if ishpc and not isslurm and not args.max_worker_rss:
+        num_cpus = 2
+    return num_cpus
+
+
+def start_phase_pool(args, jobs) -> ProcessPoolExecutor:
+    pool = ProcessPoolExecutor(
+        max_workers=jobs,
+        mp_context=get_context(args.start_method),
+        initializer=archive.remount,
+        initargs=(archive.mounted(),),
+    )
+    # Start the workers before any phase thread runs, so that forking
+    # doesn't copy a lock one of them holds.
+    pool.submit(int).result()
+    logging.debug(f"Started {jobs} phase pool workers.")
+    return pool
+
+
+def start_phases(
+    args, config, script_dir, inventory, handle_resolver
+) -> Tuple[PhaseGraph, List[str], ProcessPoolExecutor]:
+    # Returns the started phases, the names of the background ones and the
+    # process pool shared by the structure, link and permalink phases.
+    ead_file = os.path.abspath(args.ead_file)
+    html_dir = os.path.abspath(args.html_dir)
+
+    if args.indent_dir:
+        pretty_ead_file = os.path.join(
+            args.indent_dir,
+            Path(archive.uncompressed_name(ead_file)).stem + "-pretty.xml",
+        )
+    else:
+        pretty_ead_file = util.change_ext(
+            archive.uncompressed_name(ead_file), "-pretty.xml"
+        )
+    indent_file = os.path.join(script_dir, "indent.xsl")
+    schema_file = os.path.join(script_dir, "ead.xsd")
+    tidyrc = os.path.join(script_dir, "tidyrc")
+    top_html_file = os.path.join(html_dir, "index.html")
+    rqm_html_file = os.path.join(html_dir, "requestmaterials", "index.html")
+    all_html_file = os.path.join(html_dir, "all", "index.html")
 
+    # The structure, link and permalink phases share a process pool with
+    # the same worker budget as the component checks. The permalink index
+    # is done before the component checks start, but the structure and
+    # link phases run alongside component workers, so then the pool only
+    # gets half the budget.
+    pool_phases = []
+    if args.tidy:
+        pool_phases.append("tidy")
     if args.broken_links:
-        links = defaultdict(set)
-        for file in html_files:
-            for url in util.get_links(file):
-                links[url].add(file)
-        urls = sorted(list(links.keys()))
-        logging.trace(f"Testing the following links: {pformat(urls)}")
-        broken_links = util.find_broken_links(urls)
-        if broken_links:
-            logging.warn("The following links are broken {broken_links}")
-
-    path_tidy = shutil.which("tidy")
-    if args.tidy and path_tidy:
-        for file in html_files:
-            ret = util.do_cmd(
-                [path_tidy, "-config", tidyrc, file],
-                allowed_returncodes=[1],
-                stdout=PIPE,
-                stderr=PIPE,
-            )
-            if ret:
-                logging.debug(ret.stderr)
-                indented_file = os.path.splitext(file)[0] + "-tidy.html"
-                if args.indent and not os.path.exists(indented_file):
-                    with open(indented_file, "w") as wfh:
-                        wfh.write(ret.stdout)
+        pool_phases.append("links")
+    if "dao" in config["checks"]["component"]:
+        pool_phases.append("permalink index")
+    phase_jobs = args.workers or worker_budget(args)
+    if (args.tidy or args.broken_links) and args.multiprocessing:
+        phase_jobs = max(1, phase_jobs // 2)
+    phase_pool = None
+    if pool_phases and phase_jobs > 1:
+        phase_pool = start_phase_pool(args, phase_jobs)
+
+    # The component checks need the parsed EAD and HTML and a valid EAD.
+    # Indenting, tidy and the link checks only log or write files, so they
+    # carry on alongside the component checks, and only get a phase thread
+    # when none of the others is waiting for one.
+    phases = PhaseGraph(args.phase_threads)
+    background = []
+    if args.indent:
+        phases.add(
+            "indent",
+            functools.partial(
+                indent_xml, ead_file, pretty_ead_file, indent_file
+            ),
+            priority=-1,
+        )
+        background.append("indent")
+    phases.add(
+        "validate xml", functools.partial(validate_xml, ead_file, schema_file)
+    )
+    if args.tidy:
+        phases.add(
+            "tidy",
+            functools.partial(
+                tidy_html, inventory, args, tidyrc, phase_pool, phase_jobs
+            ),
+            priority=-1,
+        )
+        background.append("tidy")
+    if args.broken_links:
+        phases.add(
+            "links",
+            functools.partial(
+                check_links,
+                inventory.html_files(),
+                args,
+                phase_pool,
+                phase_jobs,
+            ),
+            priority=-1,
+        )
+        background.append("links")
+    phases.add("parse ead", functools.partial(Ead, ead_file))
+    if "dao_link" in config["checks"]["component"]:
+        # Resolved in a batch up front, component checks find them cached.
+        phases.add(
+            "resolve handles",
+            lambda: resolve_handles(
+                handle_resolver, phases.result("parse ead")
+            ),
+            deps=["parse ead"],
+        )
+    if "dao" in config["checks"]["component"]:
+        phases.add(
+            "permalink index",
+            functools.partial(
+                PermalinkIndex.build,
+                html_dir,
+                jobs=phase_jobs,
+                cache_file=util.cache_file(
+                    args.cache_dir, "permalinks", html_dir
+                ),
+                executor=phase_pool,
+                inventory=inventory,
+            ),
+        )
+    phases.add(
+        "parse index html",
+        functools.partial(EADHTML, top_html_file, parser=args.html_parser),
+    )
+    phases.add(
+        "parse requestmaterials html",
+        functools.partial(
+            RequestMaterials, rqm_html_file, parser=args.html_parser
+        ),
+    )
+    phases.add(
+        "parse all html",
+        functools.partial(EADHTML, all_html_file, parser=args.html_parser),
+    )
+    if phase_pool:
+        phases.when_done(pool_phases, phase_pool.shutdown)
+    phases.start()
+    return phases, background, phase_pool
+
+
+def tidy_html(inventory, args, tidyrc, pool=None, jobs=1) -> None:
+    backend = args.tidy_backend
+    if backend == "tidy" and not shutil.which("tidy"):
+        logging.warning("tidy isn't installed, checking the HTML with lxml.")
+        backend = "lxml"
+    cache = VerdictCache(
+        util.cache_file(
+            args.cache_dir,
+            "structure",
+            backend,
+            util.hash_file(tidyrc),
+            inventory.root,
+        )
+    )
+    verdicts = check_files(
+        inventory.html_files(),
+        backend,
+        args.tidy_jobs or jobs,
+        tidyrc,
+        cache=cache,
+        indent=args.indent
+        and backend == "tidy"
+        and not archive.is_archive(inventory.root),
+        executor=pool,
+        inventory=inventory,
+    )
+    cache.save()
+    failed = 0
+    for file, messages in verdicts.items():
+        if has_errors(messages, backend):
+            failed += 1
+        if messages:
+            logging.debug(f"{file}:\n" + "\n".join(messages))
+    logging.info(
+        f"Structure check with {backend} found errors in {failed} of"
+        f" {len(verdicts)} HTML files, {cache.hits} verdicts were cached."
+    )
 
 
 def validate_xml(xml_file, schema_file) -> None:
@@ -264,7 +516,7 @@ def validate_xml(xml_file, schema_file) -> None:
     else:
         try:
             schema = ET.XMLSchema(ET.parse(schema_file))
-            result = schema.validate(ET.parse(xml_file))
+            result = schema.validate(archive.parse_xml(xml_file))
         except Exception as e:
             raise e
 
@@ -302,6 +554,190 @@ def passed_str(passed) -> str:
     return status
 
 
+def compare_results(
+    errors,
+    scope,
+    method_name,
+    cid,
+    ead_rs,
+    html_rs,
+    files=None,
+    inline_limit=None,
+) -> bool:
+    if ead_rs is not None and html_rs is None:
+        kind, missing = "missing", "html"
+    elif ead_rs is None and html_rs is not None:
+        kind, missing = "missing", "ead"
+    elif not compare(get_values(ead_rs), get_values(html_rs)):
+        kind, missing = "diff", None
+    else:
+        return True
+
+    record = {
+        "kind": kind,
+        "scope": scope,
+        "field": method_name,
+        "cid": cid,
+        "ead_result": pack_result(ead_rs, inline_limit),
+        # The parent doesn't parse the component pages, so HTML values are
+        # always sent inline.
+        "html_result": pack_result(html_rs),
+    }
+    if missing:
+        record["missing"] = missing
+    if files:
+        record.update(files)
+    errors.append(record)
+    return False
+
+
+def expand_record(record, ead_file, html_file, config) -> dict:
+    record = dict(record)
+    record.setdefault("ead_file", ead_file)
+    record.setdefault("html_file", html_file)
+    for side in ["ead_result", "html_result"]:
+        packed = record.get(side)
+        if packed is None or "xpath" in packed:
+            continue
+        if packed.get("digest"):
+            packed = reextract_ead_result(record, packed, config)
+        record[side] = {
+            "value_type": packed["value_type"],
+            "xpath": None,
+            "results": [
+                {"tag": tag, "value": value, "lineno": lineno}
+                for tag, value, lineno in packed["results"]
+            ],
+        }
+    return record
+
+
+def pack_result(rs, inline_limit=None) -> dict:
+    if rs is None:
+        return None
+    results = [
+        (result["tag"], result["value"], result["lineno"])
+        for result in rs.all_values()
+    ]
+    packed = {"value_type": rs.value_type.__name__, "results": results}
+    if inline_limit is not None:
+        size = sum(
+            len(value) if type(value) is str else len(json.dumps(value))
+            for tag, value, lineno in results
+        )
+        if size > inline_limit:
+            # The parent has the same EAD, so send a digest instead of
+            # the text and extract the values again if it's reported.
+            packed = {
+                "value_type": packed["value_type"],
+                "digest": util.hash_bytes(json.dumps(results).encode()),
+                "linenos": [lineno for tag, value, lineno in results],
+            }
+    return packed
+
+
+def reextract_ead_result(record, packed, config) -> dict:
+    global ead, ead_index
+    if ead_index is None:
+        ead_index = {c.get("id"): c for c in ead.root.iter("c")}
+    c = Component(ead_index[record["cid"]])
+    comp_method = getattr(c, record["field"])
+    args = []
+    if record["field"] == "dao":
+        args = [config["dao"]["valid-roles"]]
+    result = pack_result(comp_method(*args))
+    digest = util.hash_bytes(json.dumps(result["results"]).encode())
+    if digest != packed["digest"]:
+        logging.warning(
+            f"EAD values for {record['field']} of {record['cid']} don't"
+            " match the values checked by the worker"
+        )
+    return result
+
+
+def render_error(record, diff_cfg) -> str:
+    kind = record["kind"]
+    if kind == "message":
+        return record["message"]
+    elif kind == "tree":
+        return "Nesting error" + diff(
+            record["expected"], record["found"], diff_cfg
+        )
+    elif kind == "nesting":
+        expected = [tuple(id_level) for id_level in record["expected"]]
+        found = [tuple(id_level) for id_level in record["found"]]
+        if record["cid"] is None:
+            where = "top level"
+        else:
+            where = f"level ({record['cid']}, {record['level']})"
+        return (
+            f"Nesting level error at {where}:\nExpected:\n"
+            f"{pformat(expected)}\nbut got:\n{pformat(found)}"
+        )
+
+    method_name = record["field"]
+    ead_rs = from_dict(record["ead_result"])
+    html_rs = from_dict(record["html_result"])
+
+    if kind == "missing" and record["scope"] == COMPONENT:
+        template = (
+            "Value not set for field '{}' in component"
+            " '{}' inside {} file '{}' \nbut found"
+            " values:\n{}\ninside '{}'"
+        )
+        if record["missing"] == "html":
+            return template.format(
+                bold(method_name),
+                record["cid"],
+                "html",
+                record["html_file"],
+                format_vals(ead_rs),
+                record["ead_file"],
+            )
+        else:
+            return template.format(
+                method_name,
+                record["cid"],
+                "ead xml",
+                record["ead_file"],
+                format_vals(html_rs),
+                record["html_file"],
+            )
+    elif kind == "missing":
+        template = (
+            "Value not set for {} field '{}'"
+            " inside file '{}' \nbut found"
+            " values:\n{}\ninside '{}'"
+        )
+        if record["missing"] == "html":
+            return template.format(
+                "html",
+                bold(method_name),
+                record["html_file"],
+                format_vals(ead_rs),
+                record["ead_file"],
+            )
+        else:
+            return template.format(
+                "ead",
+                bold(method_name),
+                record["ead_file"],
+                format_vals(html_rs),
+                record["html_file"],
+            )
+
+    if record["scope"] == COMPONENT:
+        heading = f"field '{method_name}' differs for c id='{record['cid']}'"
+    else:
+        heading = f"ead field '{method_name}' differs'"
+    return (
+        f"{heading}\nDIFF:\n"
+        + f"{record['ead_file']}\n"
+        + f"{record['html_file']}\n"
+        + diff(get_values(ead_rs), get_values(html_rs), diff_cfg)
+    )
+
+
 def check_retval(retval, name) -> None:
     if retval is not None and not isinstance(retval, ResultSet):
         raise ValueError(
@@ -309,27 +745,20 @@ def check_retval(retval, name) -> None:
         )
 
 
-def validate_component(
-    cid,
-    comp_dir,
-    config,
-    basedir,
-    lock,
-) -> List[str]:
-    errors = Errors(config.get("exit_on_error", False))
+def failed_record(cid, error) -> dict:
+    return {
+        "kind": "message",
+        "scope": COMPONENT,
+        "cid": cid,
+        "message": f"Checks for {cid} failed with exception: {error}",
+    }
 
-    global ead
-    c = Component(ead.get_component(cid))
 
-    logging.debug("----")
-    logging.debug(c.id)
-    logging.debug(c.level)
-    logging.debug(c.title())
-    logging.debug("\n")
+def comp_html_file(basedir, comp_dir) -> str:
+    return os.path.join(basedir, "contents", comp_dir, "index.html")
 
-    html_file = os.path.join(basedir, "contents", comp_dir, "index.html")
-    logging.debug(f"HTML file: {html_file}")
 
+def load_ehtml(html_file, config, lock) -> EADHTML:
     global ehtml_cache
     with lock:
         if html_file in ehtml_cache:
@@ -337,25 +766,17 @@ def validate_component(
             ehtml = ehtml_cache[html_file]
         else:
             logging.debug(f"Adding {html_file} to EADHTML cache.")
-            ehtml = EADHTML(html_file, parser=config["html_parser"])
+            ehtml = EADHTML(
+                html_file,
+                parser=config["html_parser"],
+                markup=prefetched.get(html_file),
+            )
             ehtml_cache[html_file] = ehtml
+    return ehtml
 
-    try:
-        chtml = ehtml.find_component(c.id)
-    except ComponentNotFoundError as e:
-        # errors.append(traceback.format_exc())
-        errors.append(repr(e))
-        return
-
-    logging.debug(f"chtml id:     {chtml.id}")
-    logging.debug(f"chtml level:  {chtml.level}")
-    logging.debug(f"chtml title:  {chtml.title()}")
-    logging.debug(f"chtml extent: {chtml.extent()}")
-
-    logging.debug(f"component tag: {c.c.tag}")
-
-    logging.info(f"Performing checks for component {c.id}")
 
+def extract_component(c, config) -> dict:
+    values = {LEVEL: c.level}
     for method_name in config["checks"]["component"]:
         comp_method = getattr(c, method_name)
 
@@ -366,76 +787,649 @@ def validate_component(
         comp_retval = comp_method(*args)
         logging.debug(f"retval={comp_retval}")
         check_retval(comp_retval, method_name)
+        values[method_name] = comp_retval
+
+    values[SUB_COMPONENTS] = [
+        (subc.id, subc.level) for subc in c.sub_components()
+    ]
+    return values
 
-        comp_values = get_values(comp_retval)
 
-        logging.debug(f"calling CompHTML.{method_name}()")
+def extract_comphtml(chtml, config, basedir) -> dict:
+    values = {}
+    for method_name in config["checks"]["component"]:
         chtml_method = getattr(chtml, method_name)
+
+        logging.debug(f"calling CompHTML.{method_name}()")
         args = []
         if method_name == "dao":
             args = [basedir, config["dao"]["valid-roles"]]
         chtml_retval = chtml_method(*args)
         logging.debug(f"retval={chtml_retval}")
         check_retval(chtml_retval, method_name)
+        values[method_name] = chtml_retval
 
-        chtml_values = get_values(chtml_retval)
+    values[SUB_COMPONENTS] = chtml.component_id_level()
+    return values
 
-        missing_err_template = (
-            "Value not set for field '{}' in component"
-            " '{}' inside {} file '{}' \nbut found"
-            " values:\n{}\ninside '{}'"
-        )
 
-        passed_check = False
-        if comp_retval is not None and chtml_retval is None:
-            errors.append(
-                missing_err_template.format(
-                    bold(method_name),
-                    c.id,
-                    "html",
-                    html_file,
-                    format_vals(comp_retval),
-                    ead.ead_file,
-                )
-            )
-        elif comp_retval is None and chtml_retval is not None:
-            errors.append(
-                missing_err_template.format(
-                    method_name,
-                    c.id,
-                    "ead xml",
-                    ead.ead_file,
-                    format_vals(chtml_retval),
-                    html_file,
-                )
-            )
+def load_component_values(cid, config) -> dict:
+    global ead, records, snapshots
+    if records:
+        comp_values = records.get(cid)
+        if comp_values is not None:
+            return comp_values
+
+    check_names = config["checks"]["component"]
+    comp_values = None
+    if snapshots:
+        comp_values = snapshots.load(ead.ead_file, cid, check_names)
+    if comp_values is None:
+        c = Component(ead.get_component(cid))
+
+        logging.debug("----")
+        logging.debug(c.id)
+        logging.debug(c.level)
+        logging.debug(c.title())
+        logging.debug("\n")
+
+        logging.debug(f"component tag: {c.c.tag}")
+
+        comp_values = extract_component(c, config)
+        if snapshots:
+            snapshots.save(ead.ead_file, cid, comp_values)
+    return comp_values
+
+
+def validate_component(
+    cid,
+    comp_dir,
+    config,
+    basedir,
+    lock,
+) -> List[dict]:
+    global snapshots
+    check_names = config["checks"]["component"]
+
+    html_file = comp_html_file(basedir, comp_dir)
+    logging.debug(f"HTML file: {html_file}")
+
+    # Errors are returned to the caller, which decides whether to stop.
+    errors = Errors()
+
+    comp_values = load_component_values(cid, config)
+
+    chtml_values = None
+    if snapshots:
+        chtml_values = snapshots.load(html_file, cid, check_names)
+    if chtml_values is None:
+        ehtml = load_ehtml(html_file, config, lock)
+
+        try:
+            chtml = ehtml.find_component(cid)
+        except ComponentNotFoundError as e:
+            # errors.append(traceback.format_exc())
+            chtml_values = {NOT_FOUND: repr(e)}
         else:
-            passed_check = compare(comp_values, chtml_values)
-            if not passed_check:
-                errors.append(
-                    f"field '{method_name}' differs for c id='{c.id}'\nDIFF:\n"
-                    + f"{ead.ead_file}\n"
-                    + f"{html_file}\n"
-                    + diff(comp_values, chtml_values, config["diff"])
-                )
+            logging.debug(f"chtml id:     {chtml.id}")
+            logging.debug(f"chtml level:  {chtml.level}")
+            logging.debug(f"chtml title:  {chtml.title()}")
+            logging.debug(f"chtml extent: {chtml.extent()}")
+
+            chtml_values = extract_comphtml(chtml, config, basedir)
+        if snapshots:
+            snapshots.save(html_file, cid, chtml_values)
 
-        logging.info(f"{c.id} {method_name}: [{passed_str(passed_check)}]")
+    if NOT_FOUND in chtml_values:
+        errors.append(
+            {
+                "kind": "message",
+                "scope": COMPONENT,
+                "cid": cid,
+                "message": chtml_values[NOT_FOUND],
+            }
+        )
+        return list(errors)
+
+    logging.info(f"Performing checks for component {cid}")
+
+    for method_name in check_names:
+        passed_check = compare_results(
+            errors,
+            COMPONENT,
+            method_name,
+            cid,
+            comp_values[method_name],
+            chtml_values[method_name],
+            inline_limit=config["inline_limit"],
+        )
+        logging.info(f"{cid} {method_name}: [{passed_str(passed_check)}]")
 
-    ead_subc_list = c.sub_components()
-    ead_cids = [(subc.id, subc.level) for subc in ead_subc_list]
-    html_cids = chtml.component_id_level()
+    ead_cids = comp_values[SUB_COMPONENTS]
+    html_cids = chtml_values[SUB_COMPONENTS]
 
     logging.debug(f"EAD CIDS {ead_cids}")
     logging.debug(f"HTML CIDS {html_cids}")
 
     if ead_cids != html_cids:
         errors.append(
-            f"Nesting level error at level ({c.id},"
-            f" {c.level}):\nExpected:\n{pformat(ead_cids)}\nbut"
-            f" got:\n{pformat(html_cids)}"
+            {
+                "kind": "nesting",
+                "scope": COMPONENT,
+                "cid": cid,
+                "level": comp_values[LEVEL],
+                "expected": ead_cids,
+                "found": html_cids,
+            }
+        )
+
+    return list(errors)
+
+
+def run_top_level_check(
+    ead, top_ehtml, all_ehtml, method_name, config
+) -> Tuple[List[dict], float]:
+    start = time.time()
+    errors = Errors()
+
+    ead_method = getattr(ead, method_name)
+
+    logging.debug(f"calling EAD.{method_name}()")
+    ead_retval = ead_method()
+    logging.debug(f"retval={ead_retval}")
+    check_retval(ead_retval, method_name)
+
+    logging.debug(f"calling EADHTML.{method_name}()")
+    if method_name in config["all-html"]["fields"]:
+        logging.debug("Using all html.")
+        ehtml = all_ehtml
+    else:
+        ehtml = top_ehtml
+    ehtml_method = getattr(ehtml, method_name)
+    ehtml_retval = ehtml_method()
+    logging.debug(f"retval={ehtml_retval}")
+    check_retval(ehtml_retval, method_name)
+
+    passed_check = compare_results(
+        errors,
+        TOP_LEVEL,
+        method_name,
+        None,
+        ead_retval,
+        ehtml_retval,
+        files={"ead_file": ead.ead_file, "html_file": ehtml.html_file},
+    )
+
+    duration = time.time() - start
+    logging.info(
+        f"{method_name}: [{passed_str(passed_check)}] in {duration:.2f}"
+        " seconds"
+    )
+    return list(errors), duration
+
+
+def run_nesting_checks(ead, all_ehtml) -> Tuple[List[dict], float]:
+    start = time.time()
+    errors = Errors()
+
+    ead_file = ead.ead_file
+    all_html_file = all_ehtml.html_file
+
+    ead_cids = [(c.id, c.level) for c in ead.component()]
+    html_cids = all_ehtml.component_id_level()
+
+    logging.info("Performing nesting level check.")
+
+    ead_tree = render_level_tree(ead, ead_file)
+    ead_tree_str = "".join(ead_tree)
+    logging.debug(f"EAD Nesting Level Tree\n{ead_tree_str}")
+
+    html_tree = render_level_tree(all_ehtml, all_html_file)
+    html_tree_str = "".join(html_tree)
+    logging.debug(f"HTML Nesting Level Tree\n{html_tree_str}")
+
+    passed_check = ead_tree[1:] == html_tree[1:]
+    logging.info(f"nesting levels: [{passed_str(passed_check)}]")
+    if not passed_check:
+        errors.append(
+            {
+                "kind": "tree",
+                "scope": TOP_LEVEL,
+                "ead_file": ead_file,
+                "html_file": all_html_file,
+                "expected": ead_tree_str,
+                "found": html_tree_str,
+            }
+        )
+
+    del ead_tree, ead_tree_str, html_tree, html_tree_str
+
+    logging.debug(f"EAD CIDS {pformat(ead_cids)}")
+    logging.debug(f"HTML CIDS {pformat(html_cids)}")
+
+    if ead_cids != html_cids:
+        errors.append(
+            {
+                "kind": "nesting",
+                "scope": TOP_LEVEL,
+                "cid": None,
+                "ead_file": ead_file,
+                "html_file": all_html_file,
+                "expected": ead_cids,
+                "found": html_cids,
+            }
+        )
+
+    return list(errors), time.time() - start
+
+
+def top_level_tasks(ead, top_ehtml, all_ehtml, config) -> List[tuple]:
+    tasks = [
+        (
+            method_name,
+            functools.partial(
+                run_top_level_check,
+                ead,
+                top_ehtml,
+                all_ehtml,
+                method_name,
+                config,
+            ),
+        )
+        for method_name in config["checks"]["top-level"]
+    ]
+    tasks.append(
+        ("nesting", functools.partial(run_nesting_checks, ead, all_ehtml))
+    )
+    return tasks
+
+
+class TopLevelChecks:
+    """
+    Run the checks of the collection as a whole and add their errors to
+    the reporter. Without a thread pool they run right away, with one they
+    run alongside the component checks and their futures are in tasks.
+    """
+
+    def __init__(self, tasks, errors, ead_file, config, pool=None):
+        self.pending = list(tasks)
+        self.errors = errors
+        self.ead_file = ead_file
+        self.config = config
+        self.pool = pool
+        self.tasks = {}
+        self.records = []
+        self.times = {}
+        self.incomplete = False
+        self.start_time = None
+
+    def add(self, name, get_result) -> List[dict]:
+        try:
+            records, self.times[name] = get_result()
+        except Exception as e:
+            logging.error(f"Top level check {name} failed: {e!r}")
+            self.incomplete = True
+            records = [
+                {
+                    "kind": "message",
+                    "scope": TOP_LEVEL,
+                    "cid": None,
+                    "message": (
+                        f"Top level check {name} failed with exception: {e!r}"
+                    ),
+                }
+            ]
+        records = [
+            expand_record(record, self.ead_file, None, self.config)
+            for record in records
+        ]
+        self.records.extend(records)
+        self.errors.extend(records)
+        return records
+
+    def finish(self, stopped, exit_on_error) -> bool:
+        # Returns whether to stop on the first error.
+        if self.pending and not stopped:
+            self.start()
+        for future in as_completed(list(self.tasks)):
+            if stopped:
+                break
+            if self.add(self.tasks.pop(future), future.result) and (
+                exit_on_error
+            ):
+                stopped = True
+        for future in self.tasks:
+            future.cancel()
+        self.pool.shutdown()
+        return stopped
+
+    def run(self, exit_on_error) -> None:
+        logging.info("Performing top level checks.")
+        self.start_time = time.time()
+        for name, func in self.pending:
+            if self.add(name, func) and exit_on_error:
+                self.incomplete = True
+                break
+        self.pending = []
+
+    def start(self) -> None:
+        # Called once component workers are running so that forked workers
+        # don't inherit these threads.
+        if not self.pending:
+            return
+        logging.info("Performing top level checks.")
+        self.start_time = time.time()
+        for name, func in self.pending:
+            self.tasks[self.pool.submit(func)] = name
+        self.pending = []
+
+    def wait(self, exit_on_error) -> bool:
+        # Returns whether to stop on the first error.
+        stopped = False
+        for future in as_completed(list(self.tasks)):
+            if self.add(self.tasks.pop(future), future.result) and (
+                exit_on_error
+            ):
+                stopped = True
+        return stopped
+
+
+def validate_component_incremental(
+    cid,
+    comp_dir,
+    config,
+    basedir,
+    lock,
+    cached,
+) -> Tuple[List[dict], str]:
+    html_file = comp_html_file(basedir, comp_dir)
+    ehtml = load_ehtml(html_file, config, lock)
+    try:
+        html_hash = hash_fragment(ehtml.find_component(cid).c)
+    except ComponentNotFoundError:
+        html_hash = None
+
+    if html_hash is not None and cached.get("html_hash") == html_hash:
+        logging.debug(f"HTML for {cid} unchanged, reusing cached errors.")
+        errors = cached["errors"]
+    else:
+        errors = validate_component(cid, comp_dir, config, basedir, lock)
+    return errors, html_hash
+
+
+def init_worker(
+    validate_func,
+    config,
+    basedir,
+    lock,
+    in_flight=None,
+    pinning=None,
+    state=None,
+) -> None:
+    global worker_ctx, worker_in_flight, worker_stats
+    start = time.time()
+    if state:
+        load_worker_state(state, config)
+    if pinning:
+        pin_worker(*pinning)
+    worker_ctx = (validate_func, config, basedir, lock)
+    worker_in_flight = in_flight
+    worker_stats = {
+        "pid": os.getpid(),
+        "warmup": time.time() - start,
+        "tasks": 0,
+    }
+    logging.debug(
+        f"Worker {os.getpid()} ready in {worker_stats['warmup']:.2f} seconds."
+    )
+
+
+def pin_worker(mode, counter) -> None:
+    with counter.get_lock():
+        slot = counter.value
+        counter.value += 1
+    cpus = pin_cpus(slot, mode)
+    os.sched_setaffinity(0, cpus)
+    logging.debug(f"Worker {os.getpid()} pinned to cpus {sorted(cpus)}.")
+
+
+def load_worker_state(state, config) -> None:
+    # Workers that weren't forked from the main process don't inherit its
+    # logging setup or globals.
+    global ead, ead_index, ehtml_cache, records, snapshots, colors_enabled
+    logging.basicConfig(
+        format=config["log_format"],
+        datefmt="%m/%d/%Y %I:%M:%S %p",
+        level=state["log_level"],
+    )
+    if not hasattr(logging, "TRACE"):
+        util.addLoggingLevel("TRACE", logging.DEBUG - 5)
+    colors_enabled = config["color"] or "color" in config["diff_type"]
+    if state["records"]:
+        # Component values come from the shared records instead.
+        records = RecordStore.attach(state["records"])
+        ead = None
+    else:
+        records = None
+        ead = Ead(state["ead_file"])
+    ead_index = None
+    ehtml_cache = EHTMLCache(maxsize=EHTML_CACHE_SIZE)
+    snapshots = open_snapshots(config, state["permalinks"])
+    open_handles(config)
+    archive.remount(state["archives"])
+    if state["permalinks"]:
+        set_index(state["permalinks"])
+
+
+def handle_urls(ead) -> List[str]:
+    return [
+        url
+        for url in ead.root.xpath(
+            "//c/did/*[self::dao or self::daogrp]"
+            "/descendant-or-self::*/@*[local-name()='href']"
+        )
+        if urlsplit(url).netloc == "hdl.handle.net"
+    ]
+
+
+def resolve_handles(resolver, ead) -> None:
+    urls = handle_urls(ead)
+    targets = resolver.resolve_all(urls)
+    resolver.save()
+    logging.info(
+        f"Resolved {len(targets)} of {len(set(urls))} handles,"
+        f" {resolver.num_resolved} from the handle server."
+    )
+
+
+def open_handles(config) -> HandleResolver:
+    resolver = HandleResolver(
+        cache_file=util.cache_file(config["cache_dir"], "handles", "targets"),
+        offline=config["offline"],
+        timeout=config["link_timeout"],
+    )
+    set_resolver(resolver)
+    return resolver
+
+
+def check_salt(config, permalink_index=None) -> str:
+    # Extracted values and errors depend on the checks, the DAO roles and
+    # the pages DAO links point to, not just on the documents.
+    config_hash = util.hash_bytes(
+        json.dumps(
+            {"checks": config["checks"], "dao": config["dao"]},
+            sort_keys=True,
+        ).encode()
+    )
+    salt = f"{config['html_parser']}:{config_hash}"
+    if permalink_index:
+        salt += f":{permalink_index.digest()}"
+    return salt
+
+
+def open_snapshots(config, permalink_index=None) -> SnapshotStore:
+    if not config["snapshot"]:
+        return None
+    os.makedirs(config["cache_dir"], exist_ok=True)
+    return SnapshotStore(
+        os.path.join(config["cache_dir"], "snapshots.sqlite"),
+        salt=check_salt(config, permalink_index),
+    )
+
+
+def validate_chunk(
+    task_id, chunk, markup=None
+) -> Tuple[list, float, float, dict]:
+    global prefetched, worker_ctx, worker_in_flight, worker_stats
+    validate_func, config, basedir, lock = worker_ctx
+    prefetched = markup or {}
+
+    # Lets the parent tell which tasks were running if a worker dies.
+    if worker_in_flight is not None:
+        worker_in_flight[task_id] = 1
+    start = time.time()
+    results = []
+    for cid, comp_dir, extra_args in chunk:
+        try:
+            result = validate_func(
+                cid, comp_dir, config, basedir, lock, *extra_args
+            )
+        except Exception as e:
+            logging.debug(traceback.format_exc())
+            results.append((cid, False, repr(e)))
+            continue
+        results.append((cid, True, result))
+        if config["exit_on_error"] and (
+            result[0] if isinstance(result, tuple) else result
+        ):
+            break
+    prefetched = {}
+    worker_stats["tasks"] += 1
+    if worker_in_flight is not None:
+        worker_in_flight[task_id] = 0
+    return results, start, time.time(), dict(worker_stats, rss=util.rss())
+
+
+def start_workers(
+    args, max_workers, start_method, chunks, initargs, state=None
+) -> Tuple[TaskPool, Prefetcher]:
+    if args.multiprocessing:
+        exec_class = ProcessPoolExecutor
+        mp_context = get_context(start_method)
+        exec_args = {"mp_context": mp_context, "max_workers": max_workers}
+        lock = mp_context.Manager().Lock()
+    else:
+        exec_class = ThreadPoolExecutor
+        exec_args = {"max_workers": max_workers}
+        lock = threading.Lock()
+
+    logging.info(f"Using {max_workers} max workers for {exec_class.__name__}.")
+
+    in_flight = None
+    pinning = None
+    if args.multiprocessing:
+        in_flight = mp_context.Array("b", len(chunks), lock=False)
+        if args.pin_workers:
+            pinning = (args.pin_workers, mp_context.Value("i"))
+    exec_args["initializer"] = init_worker
+    exec_args["initargs"] = initargs + (lock, in_flight, pinning)
+    if state:
+        exec_args["initargs"] += (state,)
+
+    # Bounding the submitted and prefetched tasks keeps memory flat.
+    depth = TASKS_PER_WORKER * max_workers
+    prefetcher = None
+    if args.prefetch:
+        prefetcher = Prefetcher(args.prefetch, depth)
+        basedir = initargs[2]
+        chunk_files = [
+            sorted(
+                {comp_html_file(basedir, comp_dir) for _, comp_dir, _ in chunk}
+            )
+            for chunk in chunks
+        ]
+
+    def submit(executor, i, upcoming) -> Future:
+        markup = None
+        if prefetcher:
+            prefetcher.fill((j, chunk_files[j]) for j in chain([i], upcoming))
+            markup = prefetcher.get(i, chunk_files[i])
+        return executor.submit(validate_chunk, i, chunks[i], markup)
+
+    def make_executor() -> Executor:
+        if pinning:
+            pinning[1].value = 0
+        return exec_class(**exec_args)
+
+    check_worker = None
+    if args.multiprocessing:
+        check_worker = functools.partial(
+            recycle_reason,
+            max_tasks=args.max_tasks_per_worker,
+            max_rss=args.max_worker_rss and args.max_worker_rss * 2**20,
+        )
+    pool = TaskPool(
+        chunks,
+        submit,
+        make_executor,
+        depth,
+        in_flight=in_flight,
+        check_worker=check_worker,
+    )
+    return pool, prefetcher
+
+
+def log_pool_stats(pool, max_workers, args, prefetcher=None) -> str:
+    # Returns the summary of the workers' RSS, if they're processes.
+    p = inflect.engine()
+    pool_time = time.time() - pool.start_time
+    if prefetcher and pool.num_done:
+        prefetch_util = prefetcher.busy_time / (pool_time * args.prefetch)
+        worker_util = pool.busy_time / (pool_time * max_workers)
+        logging.info(
+            f"Pipeline utilization: prefetch {prefetch_util:.0%} of"
+            f" {p.no('thread', args.prefetch)} reading"
+            f" {p.no('file', prefetcher.num_files)}"
+            f" ({prefetcher.num_bytes / 2**20:.1f} MB), workers"
+            f" {worker_util:.0%}, results"
+            f" {pool.results_time / pool_time:.0%} of the main thread,"
+            f" which waited {prefetcher.wait_time:.2f} seconds for"
+            " prefetched files."
         )
 
-    return errors
+    if pool.num_done:
+        utilization = pool.busy_time / (pool_time * max_workers)
+        logging.info(
+            f"Ran {pool.num_done} tasks in {pool_time:.2f} seconds at"
+            f" {utilization:.0%} worker utilization. Per task:"
+            f" {pool.busy_time / pool.num_done:.4f} seconds of checks,"
+            f" {pool.return_time / pool.num_done:.4f} seconds of overhead"
+            " returning results."
+        )
+    if not (pool.workers and args.multiprocessing):
+        return None
+
+    workers = pool.workers
+    warmups = [worker["warmup"] for worker in workers.values()]
+    logging.info(
+        f"{p.no('worker', len(workers))} warmed up in"
+        f" {sum(warmups) / len(warmups):.2f} seconds on average"
+        f" (max {max(warmups):.2f})."
+    )
+    peak_rss = []
+    avg_rss = []
+    for pid, worker in workers.items():
+        peak_rss.append(max(worker["rss"]) / 2**20)
+        avg_rss.append(sum(worker["rss"]) / len(worker["rss"]) / 2**20)
+        logging.debug(
+            f"Worker {pid} RSS: peak {peak_rss[-1]:.0f} MB, average"
+            f" {avg_rss[-1]:.0f} MB over {len(worker['rss'])} tasks."
+        )
+    return (
+        f"Worker RSS: peak {max(peak_rss):.0f} MB, average"
+        f" {sum(avg_rss) / len(avg_rss):.0f} MB across"
+        f" {p.no('worker', len(workers))}"
+    )
 
 
 def get_comp_dirs(elem, comp_dirs, depth, elem_dir, presentation_cids) -> None:
@@ -462,6 +1456,46 @@ def render_level_tree(elem, root_name) -> List[str]:
     return [f"{pre}{node.name}\n" for pre, fill, node in RenderTree(root)]
 
 
+def default_chunk_size(num_tasks, num_workers) -> int:
+    # Same heuristic as multiprocessing.Pool.map()
+    chunk_size, extra = divmod(num_tasks, num_workers * 4)
+    if extra:
+        chunk_size += 1
+    return max(chunk_size, 1)
+
+
+def workers_arg(value) -> object:
+    if value == "auto":
+        return value
+    try:
+        num_workers = int(value)
+    except ValueError:
+        num_workers = 0
+    if num_workers < 1:
+        raise argparse.ArgumentTypeError(
+            f"expected 'auto' or a positive number, got '{value}'"
+        )
+    return num_workers
+
+
+def diff_config(diff_type) -> dict:
+    term_width = get_term_width()
+    return {
+        "type": diff_type,
+        "term_width": term_width,
+        "sep": "-" * term_width,
+    }
+
+
+def print_summary(num_errors, results_file=None) -> None:
+    p = inflect.engine()
+    p.num(num_errors)
+    summary = f"There {p.plural_verb('is')} {p.no('error')}"
+    if results_file:
+        summary += f" (saved to {results_file})"
+    print(f"{summary}.")
+
+
 def read_config(config_file) -> dict:
     with open(config_file, "rb") as f:
         data = tomli.load(f)
@@ -472,16 +1506,59 @@ def get_values(rs) -> ResultSet:
     return rs.string_values() if rs else None
 
 
+def from_dict(data) -> ResultSet:
+    return ResultSet.from_dict(data) if data is not None else None
+
+
 def isnewer(file1, file2) -> bool:
     return os.stat(file1).st_mtime > os.stat(file2).st_mtime
 
 
-def main() -> None:
-    start_time = time.time()
-
-    if not sys.version_info >= (3, 7):
-        print("Python 3.7 or higher is required.")
-        exit(1)
+def replay(argv) -> None:
+    parser = argparse.ArgumentParser(
+        prog=f"{Path(__file__).name} replay",
+        description="Render the errors saved by a previous run.",
+    )
+    parser.add_argument(
+        "results_file", metavar="RESULTS_FILE", help="saved check results"
+    )
+    parser.add_argument(
+        "--diff-type",
+        default="simple",
+        choices=["color", "unified", "unified-color", "simple"],
+        help="diff type (default: %(default)s)",
+    )
+    parser.add_argument(
+        "-c", "--color", action="store_true", help="Enable color output"
+    )
+    args = parser.parse_args(argv)
+
+    global colors_enabled
+    colors_enabled = args.color or "color" in args.diff_type
+
+    renderer = StreamRenderer(
+        functools.partial(render_error, diff_cfg=diff_config(args.diff_type))
+    )
+    num_errors = 0
+    for error in read_results(args.results_file):
+        renderer.write(error)
+        num_errors += 1
+    renderer.close()
+
+    if num_errors:
+        print_summary(num_errors)
+    exit(1 if num_errors else 0)
+
+
+def main() -> None:
+    start_time = time.time()
+
+    if not sys.version_info >= (3, 7):
+        print("Python 3.7 or higher is required.")
+        exit(1)
+
+    if len(sys.argv) > 1 and sys.argv[1] == "replay":
+        replay(sys.argv[2:])
 
     script_dir = os.path.dirname(os.path.realpath(__file__))
     script_name = Path(__file__).stem
@@ -489,8 +1566,14 @@ def main() -> None:
     parser = argparse.ArgumentParser(
         description="Validate finding aids html against ead xml file."
     )
-    parser.add_argument("ead_file", metavar="EAD_FILE", help="ead file")
-    parser.add_argument("html_dir", metavar="HTML_DIR", help="html directory")
+    parser.add_argument(
+        "ead_file", metavar="EAD_FILE", help="ead file, may be gzipped"
+    )
+    parser.add_argument(
+        "html_dir",
+        metavar="HTML_DIR",
+        help="html directory or a .zip, .tar or .tar.gz archive of it",
+    )
     parser.add_argument(
         "--diff-type",
         default="simple",
@@ -517,13 +1600,31 @@ def main() -> None:
         "-t",
         "--tidy",
         action="store_true",
-        help="Run HTML Tidy to test correctness of html",
+        help="Check the structure of the html like HTML Tidy",
+    )
+    parser.add_argument(
+        "--tidy-backend",
+        default="lxml",
+        choices=["lxml", "tidy"],
+        help=(
+            "Check the html in process with the lxml parser or with tidy"
+            " processes, which also write the -tidy.html copies with"
+            " --indent (default: %(default)s)"
+        ),
+    )
+    parser.add_argument(
+        "--tidy-jobs",
+        type=int,
+        help=(
+            "Number of files checked at a time with --tidy-backend tidy"
+            " (default: the size of the phase pool, see --workers)"
+        ),
     )
     parser.add_argument(
         "-i",
         "--indent",
         action="store_true",
-        help="Indent XML with xsltproc.",
+        help="Indent XML with indent.xsl.",
     )
     parser.add_argument(
         "--indent-dir",
@@ -536,6 +1637,46 @@ def main() -> None:
     parser.add_argument(
         "-b", "--broken-links", action="store_true", help="Find broken urls"
     )
+    parser.add_argument(
+        "--link-timeout",
+        type=float,
+        default=10.0,
+        metavar="SECONDS",
+        help="Timeout for each link request (default: %(default)s)",
+    )
+    parser.add_argument(
+        "--link-host-limit",
+        type=int,
+        default=4,
+        help=(
+            "Number of links checked at a time on the same host (default:"
+            " %(default)s)"
+        ),
+    )
+    parser.add_argument(
+        "--link-host-rate",
+        type=float,
+        metavar="PER_SECOND",
+        help="Most link requests started per second on the same host",
+    )
+    parser.add_argument(
+        "--link-cache-ttl",
+        type=float,
+        default=24.0,
+        metavar="HOURS",
+        help=(
+            "How long link statuses are reused from the cache (default:"
+            " %(default)s)"
+        ),
+    )
+    parser.add_argument(
+        "--offline",
+        action="store_true",
+        help=(
+            "Resolve DAO handles only from the cache, without network"
+            " requests"
+        ),
+    )
     parser.add_argument(
         "-c", "--color", action="store_true", help="Enable color output"
     )
@@ -549,7 +1690,9 @@ def main() -> None:
         "-e",
         "--exit-on-error",
         action="store_true",
-        help="Exit script on first error",
+        help=(
+            "Stop on the first error, cancelling any pending component checks"
+        ),
     )
     parser.add_argument(
         "--html-parser",
@@ -563,22 +1706,203 @@ def main() -> None:
         action="store_true",
         help="Parallelize component checks with multiple processes",
     )
+    parser.add_argument(
+        "--phase-threads",
+        type=int,
+        default=4,
+        help=(
+            "Number of threads running the preflight phases, such as the"
+            " schema validation, tidy and the EAD and HTML parsing, side by"
+            " side (default: %(default)s)"
+        ),
+    )
+    parser.add_argument(
+        "--top-level-threads",
+        type=int,
+        default=2,
+        help=(
+            "Number of threads running the top level checks alongside the"
+            " component checks with --multiprocessing or --threading"
+            " (default: %(default)s)"
+        ),
+    )
+    parser.add_argument(
+        "--workers",
+        type=workers_arg,
+        help=(
+            "Number of parallel workers, which implies --multiprocessing"
+            " unless --threading is given, or 'auto' to choose it and the"
+            " parallel mode from the cpu and memory limits of the job. The"
+            " -t, -b and permalink phases share a pool of as many processes,"
+            " or half as many while -t or -b run alongside --multiprocessing"
+            " workers (default: the usable cpus, 2 on the HPC cluster outside"
+            " slurm)"
+        ),
+    )
+    parser.add_argument(
+        "--start-method",
+        default="fork",
+        choices=["fork", "forkserver", "spawn"],
+        help=(
+            "How --multiprocessing starts worker processes. Workers that"
+            " aren't forked load the EAD file themselves. fork becomes"
+            " forkserver when --prefetch is given or the -t, -b or -i phases"
+            " are still running (default: %(default)s)"
+        ),
+    )
+    parser.add_argument(
+        "--max-tasks-per-worker",
+        type=int,
+        help=(
+            "Replace worker processes after they've run this many tasks. The"
+            " whole pool is replaced once any worker reaches the limit"
+        ),
+    )
+    parser.add_argument(
+        "--max-worker-rss",
+        type=int,
+        metavar="MB",
+        help=(
+            "Replace worker processes once their resident memory exceeds"
+            " this many megabytes. The whole pool is replaced once any worker"
+            " goes over"
+        ),
+    )
+    parser.add_argument(
+        "--prefetch",
+        type=int,
+        metavar="NUM_THREADS",
+        help=(
+            "Read upcoming HTML files with this many threads and send them"
+            " to the --multiprocessing workers for parsing"
+        ),
+    )
+    parser.add_argument(
+        "--pin-workers",
+        choices=["core", "numa"],
+        help=(
+            "Pin each worker process to one core, or to the cores of one"
+            " NUMA node, spreading workers across nodes"
+        ),
+    )
+    parser.add_argument(
+        "--shared-records",
+        action="store_true",
+        help=(
+            "Extract the EAD component values up front into shared memory"
+            " that worker processes read instead of the EAD"
+        ),
+    )
     parser.add_argument(
         "--threading",
         action="store_true",
         help="Parallelize component checks with threads",
     )
+    parser.add_argument(
+        "--chunk-size",
+        type=int,
+        help=(
+            "Number of components per task with --multiprocessing or"
+            " --threading (default: based on the number of components and"
+            " workers, 1 with --exit-on-error)"
+        ),
+    )
     parser.add_argument(
         "--duration",
         action="store_true",
         help="Print rumtime duration as non-logging message",
     )
+    parser.add_argument(
+        "--checkpoint",
+        metavar="JOURNAL_FILE",
+        help="Record completed checks in a journal so the run can be resumed",
+    )
+    parser.add_argument(
+        "--resume",
+        action="store_true",
+        help="Skip checks already recorded in the --checkpoint journal",
+    )
+    parser.add_argument(
+        "--cache-dir",
+        default=os.path.join(
+            os.environ.get("XDG_CACHE_HOME", os.path.expanduser("~/.cache")),
+            "ead-html-validator",
+        ),
+        help="Directory for data kept between runs (default: %(default)s)",
+    )
+    parser.add_argument(
+        "--results-file",
+        help=(
+            "File where check results are saved for replay (default: a file"
+            " under --cache-dir)"
+        ),
+    )
+    parser.add_argument(
+        "--skip-unchanged",
+        action="store_true",
+        help=(
+            "Skip validation if the EAD and HTML files are unchanged since"
+            " the last passing run"
+        ),
+    )
+    parser.add_argument(
+        "--snapshot",
+        action="store_true",
+        help=(
+            "Store extracted EAD and HTML values by file hash and reuse"
+            " them for files that haven't changed"
+        ),
+    )
+    parser.add_argument(
+        "--incremental",
+        action="store_true",
+        help=(
+            "Only recheck components whose EAD or HTML changed since the"
+            " last run"
+        ),
+    )
     args = parser.parse_args()
 
     if args.multiprocessing and args.threading:
         print("Can't set both --multiprocessing and --threading.")
         exit(1)
 
+    if args.workers not in (None, "auto") and not args.threading:
+        # Like --workers auto, a number of workers picks a parallel mode.
+        args.multiprocessing = True
+
+    if args.chunk_size is not None and args.chunk_size < 1:
+        print("--chunk-size must be at least 1.")
+        exit(1)
+
+    if args.prefetch is not None and args.prefetch < 1:
+        print("--prefetch requires at least 1 thread.")
+        exit(1)
+
+    if args.pin_workers and not hasattr(os, "sched_setaffinity"):
+        print("--pin-workers isn't supported on this platform.")
+        exit(1)
+
+    if args.shared_records and sys.version_info < (3, 8):
+        print("--shared-records requires Python 3.8 or higher.")
+        exit(1)
+
+    if args.link_host_limit < 1:
+        print("--link-host-limit must be at least 1.")
+        exit(1)
+
+    if args.tidy_jobs is not None and args.tidy_jobs < 1:
+        print("--tidy-jobs must be at least 1.")
+        exit(1)
+
+    if args.phase_threads < 1:
+        print("--phase-threads must be at least 1.")
+        exit(1)
+
+    if args.resume and not args.checkpoint:
+        print("--resume requires --checkpoint.")
+        exit(1)
+
     global colors_enabled
     colors_enabled = args.color or "color" in args.diff_type
 
@@ -603,54 +1927,118 @@ def main() -> None:
     )
     logging.debug(f"Installed packages: {pformat(installed_pkgs)}")
 
-    config = read_config(os.path.join(script_dir, "config.toml"))
+    # Every phase looks files under the HTML directory up here rather than
+    # walking or stat'ing it again. The HTML directory may also be a zip or
+    # tar archive of the Hugo output, read in place.
+    inventory_start = time.time()
+    if archive.is_archive(args.html_dir):
+        archive.mount(
+            os.path.abspath(args.html_dir),
+            os.path.join(args.cache_dir, "archives"),
+        )
+    inventory = Inventory.scan(os.path.abspath(args.html_dir))
+    logging.info(
+        f"Found {len(inventory.files)} files"
+        f" ({inventory.total_size() / 2**20:.1f} MB) under {args.html_dir}"
+        f" in {time.time() - inventory_start:.2f} seconds."
+    )
+
+    auto_mode = None
+    if args.workers == "auto":
+        html_sizes = [
+            inventory.size(html_file)
+            for html_file in inventory.pages().values()
+        ]
+        mode, args.workers, reasons = plan_workers(
+            html_sizes,
+            EHTML_CACHE_SIZE,
+            archive.uncompressed_size(args.ead_file),
+            reserved=util.rss(),
+        )
+        if args.multiprocessing or args.threading:
+            logging.info("Keeping the parallel mode given on the command line.")
+        else:
+            auto_mode = mode
+            args.multiprocessing = mode == "multiprocessing"
+            args.threading = mode == "threading"
+        logging.info(
+            f"Auto workers: {args.workers} for {mode} mode based on"
+            f" {', '.join(reasons)}."
+        )
+
+    # Checked once --workers auto has picked the parallel mode.
+    process_flags = [
+        flag
+        for flag, value in [
+            ("--max-tasks-per-worker", args.max_tasks_per_worker),
+            ("--max-worker-rss", args.max_worker_rss),
+            ("--prefetch", args.prefetch),
+            ("--pin-workers", args.pin_workers),
+            ("--shared-records", args.shared_records),
+        ]
+        if value
+    ]
+    if process_flags and not args.multiprocessing:
+        print(
+            f"{', '.join(process_flags)} can only be used with"
+            " --multiprocessing"
+            + (
+                f", but --workers auto chose {auto_mode} mode here. Add -m"
+                " to keep --multiprocessing."
+                if auto_mode
+                else "."
+            )
+        )
+        exit(1)
+
+    config_file = os.path.join(script_dir, "config.toml")
+    config = read_config(config_file)
     logging.debug("config: %s", pformat(config))
 
+    config.update(vars(args))
+
     ead_file = os.path.abspath(args.ead_file)
     html_dir = os.path.abspath(args.html_dir)
 
     logging.debug("ead file: %s", ead_file)
     logging.debug("html dir: %s", html_dir)
 
-    if args.indent_dir:
-        pretty_ead_file = os.path.join(
-            args.indent_dir, Path(ead_file).stem + "-pretty.xml"
+    manifest = None
+    if args.skip_unchanged:
+        manifest = Manifest(
+            util.cache_file(args.cache_dir, "manifest", ead_file, html_dir),
+            ead_file,
+            html_dir,
+            extra_files=[config_file],
+            inventory=inventory,
         )
-    else:
-        pretty_ead_file = util.change_ext(ead_file, "-pretty.xml")
-    indent_file = os.path.join(script_dir, "indent.xsl")
-    xsltproc = shutil.which("xsltproc")
-    if (
-        args.indent
-        and xsltproc
-        and "pretty" not in ead_file
-        and (
-            not os.path.isfile(pretty_ead_file)
-            or isnewer(ead_file, pretty_ead_file)
-        )
-    ):
-        util.do_cmd(
-            [xsltproc, "-o", pretty_ead_file, indent_file, ead_file],
-            stdout=PIPE,
-            stderr=PIPE,
-        )
-
-    schema_file = os.path.join(script_dir, "ead.xsd")
-    validate_xml(ead_file, schema_file)
+        manifest.build()
+        if manifest.is_unchanged():
+            manifest.save()
+            collection = os.path.join(
+                Path(ead_file).parent.name, Path(ead_file).stem
+            )
+            print(
+                f"Skipped clean: {collection} is unchanged since the last"
+                " passing run."
+            )
+            exit(0)
 
-    tidyrc = os.path.join(script_dir, "tidyrc")
-    validate_html(html_dir, args, tidyrc)
+    handle_resolver = open_handles(config)
+    phases, background, phase_pool = start_phases(
+        args, config, script_dir, inventory, handle_resolver
+    )
 
-    global ead
-    ead = Ead(ead_file)
+    global ead, ead_index
+    ead = phases.result("parse ead")
+    ead_index = None
 
     num_comp = ead.c_count()
     p = inflect.engine()
     p.num(num_comp)
     logging.info(f"The EAD has {p.no('component')}.")
 
-    top_html_file = os.path.join(html_dir, "index.html")
-    top_ehtml = EADHTML(top_html_file, parser=args.html_parser)
+    top_ehtml = phases.result("parse index html")
 
     logging.info(f"FASB Version: {top_ehtml.fasb_version()}")
 
@@ -658,225 +2046,369 @@ def main() -> None:
     html_date = top_ehtml.creation_date().values()[0]
     if ead_date != html_date:
         print(f"Creation date mismatch: '{ead_date}' != '{html_date}'")
+        phases.close()
         exit(1)
 
-    rqm_html_file = os.path.join(html_dir, "requestmaterials", "index.html")
-    rqm = RequestMaterials(rqm_html_file, parser=args.html_parser)
-    logging.debug(pformat(rqm.find_links()))
-
-    all_html_file = os.path.join(html_dir, "all", "index.html")
-    all_ehtml = EADHTML(all_html_file, parser=args.html_parser)
-
-    load_thefuzz()
-
-    term_width = get_term_width()
-
-    config["diff"] = {
-        "type": args.diff_type,
-        "term_width": term_width,
-        "sep": "-" * term_width,
-    }
-
-    config.update(vars(args))
-
-    errors = Errors(config.get("exit_on_error", False))
-
-    logging.info("Performing top level checks.")
+    phases.result("validate xml")
 
-    for method_name in config["checks"]["top-level"]:
-        ead_method = getattr(ead, method_name)
+    rqm = phases.result("parse requestmaterials html")
+    logging.debug(pformat(rqm.find_links()))
 
-        logging.debug(f"calling EAD.{method_name}()")
-        ead_retval = ead_method()
-        logging.debug(f"retval={ead_retval}")
-        check_retval(ead_retval, method_name)
+    all_ehtml = phases.result("parse all html")
 
-        ead_values = get_values(ead_retval)
+    if phases.has("resolve handles"):
+        phases.result("resolve handles")
+    permalink_index = None
+    if phases.has("permalink index"):
+        permalink_index = phases.result("permalink index")
+        set_index(permalink_index)
+        logging.info(
+            f"Indexed {len(permalink_index.permalinks)} permalinks in"
+            f" {html_dir}."
+        )
 
-        logging.debug(f"calling EADHTML.{method_name}()")
-        if method_name in config["all-html"]["fields"]:
-            logging.debug("Using all html.")
-            ehtml = all_ehtml
-            html_file = all_html_file
-        else:
-            ehtml = top_ehtml
-            html_file = top_html_file
-        ehtml_method = getattr(ehtml, method_name)
-        ehtml_retval = ehtml_method()
-        logging.debug(f"retval={ehtml_retval}")
-        check_retval(ehtml_retval, method_name)
+    load_thefuzz()
 
-        ehtml_values = get_values(ehtml_retval)
+    config["diff"] = diff_config(args.diff_type)
 
-        missing_err_template = (
-            "Value not set for {} field '{}'"
-            " inside file '{}' \nbut found"
-            " values:\n{}\ninside '{}'"
-        )
+    config["inline_limit"] = (
+        INLINE_VALUE_LIMIT if args.multiprocessing else None
+    )
 
-        passed_check = False
-        if ead_retval is not None and ehtml_retval is None:
-            errors.append(
-                missing_err_template.format(
-                    "html",
-                    bold(method_name),
-                    html_file,
-                    format_vals(ead_retval),
-                    ead_file,
-                )
-            )
-        elif ead_retval is None and ehtml_retval is not None:
-            errors.append(
-                missing_err_template.format(
-                    "ead",
-                    bold(method_name),
-                    ead_file,
-                    format_vals(ehtml_retval),
-                    html_file,
-                )
+    results_file = args.results_file or util.cache_file(
+        args.cache_dir, "results", ead_file, html_dir, ext=".jsonl"
+    )
+    errors = Reporter(
+        results_file,
+        ead_file,
+        html_dir,
+        renderers=[
+            StreamRenderer(
+                functools.partial(render_error, diff_cfg=config["diff"])
             )
-        else:
-            passed_check = compare(ead_values, ehtml_values)
-            if not passed_check:
-                errors.append(
-                    f"ead field '{method_name}' differs'\nDIFF:\n"
-                    + f"{ead_file}\n"
-                    + f"{html_file}\n"
-                    + diff(ead_values, ehtml_values, config["diff"])
-                )
-
-        logging.info(f"{method_name}: [{passed_str(passed_check)}]")
+        ],
+    )
 
-    ead_comps = ead.component()
-    ead_cids = [(c.id, c.level) for c in ead_comps]
+    checkpoint = None
+    if args.checkpoint:
+        try:
+            checkpoint = Checkpoint(
+                os.path.abspath(args.checkpoint),
+                ead_file,
+                html_dir,
+                resume=args.resume,
+            )
+        except CheckpointMismatchError as e:
+            print(e)
+            exit(1)
+
+    top_pending = []
+    if checkpoint and checkpoint.is_done(TOP_LEVEL, None):
+        logging.info("Top level checks already completed, skipping.")
+        errors.extend(checkpoint.errors(TOP_LEVEL, None))
+    else:
+        top_pending = top_level_tasks(ead, top_ehtml, all_ehtml, config)
 
-    # html_cids = all_ehtml.component_id_level()
     html_comps = all_ehtml.component()
-    html_cids = [(c.id, c.level) for c in html_comps]
-
     presentation_cids = {c.id: c.present_id for c in html_comps if c.present_id}
-
-    logging.info("Performing nesting level check.")
-
-    ead_tree = render_level_tree(ead, ead_file)
-    ead_tree_str = "".join(ead_tree)
-    logging.debug(f"EAD Nesting Level Tree\n{ead_tree_str}")
-
-    html_tree = render_level_tree(all_ehtml, all_html_file)
-    html_tree_str = "".join(html_tree)
-    logging.debug(f"HTML Nesting Level Tree\n{html_tree_str}")
-
-    passed_check = ead_tree[1:] == html_tree[1:]
-    logging.info(f"nesting levels: [{passed_str(passed_check)}]")
-    if not passed_check:
-        errors.append(
-            "Nesting error" + diff(ead_tree_str, html_tree_str, config["diff"])
-        )
-
-    del all_ehtml, top_ehtml, rqm
-    del ead_tree, ead_tree_str, html_tree, html_tree_str
-
-    logging.debug(f"EAD CIDS {pformat(ead_cids)}")
-    logging.debug(f"HTML CIDS {pformat(html_cids)}")
     logging.debug(f"Presentation CIDS {pformat(presentation_cids)}")
 
-    if ead_cids != html_cids:
-        errors.append(
-            "Nesting level error at top"
-            f" level:\nExpected:\n{pformat(ead_cids)}\nbut"
-            f" got:\n{pformat(html_cids)}"
+    del all_ehtml, top_ehtml, rqm, html_comps
+
+    top_pool = None
+    if top_pending and (args.multiprocessing or args.threading):
+        top_pool = ThreadPoolExecutor(
+            max_workers=args.top_level_threads, thread_name_prefix="top-level"
         )
+    top = TopLevelChecks(top_pending, errors, ead_file, config, top_pool)
+    if top.pending and not top_pool:
+        top.run(args.exit_on_error)
+        phases.record("top level checks", top.start_time, time.time())
 
     progress_bar = tqdm(total=ead.c_count()) if args.progress_bar else None
 
     global ehtml_cache
-    ehtml_cache = EHTMLCache(maxsize=10)
+    ehtml_cache = EHTMLCache(maxsize=EHTML_CACHE_SIZE)
+
+    global snapshots
+    snapshots = open_snapshots(config, permalink_index)
 
     comp_dirs = {}
     get_comp_dirs(ead, comp_dirs, 0, "", presentation_cids)
 
-    if args.multiprocessing or args.threading:
-        try:
-            num_cpus = len(os.sched_getaffinity(0))  # Only works on Unix
-        except AttributeError:
-            num_cpus = cpu_count()
-        ishpc = "CLUSTER" in os.environ
-        isslurm = any(env.startswith("SLURM") for env in os.environ)
-        # hpc cluster reports large number of cpus which leads to a large
-        # number of processes which may get killed by the os for lack of
-        # resources. Limit to 2 except when running under slurm.
-        if ishpc and not isslurm:
-            num_cpus = 2
+    cids = sorted(ead.all_component_ids())
+    if checkpoint and args.resume:
+        done_cids = set(checkpoint.completed_ids(COMPONENT))
+        for cid in cids:
+            if cid in done_cids:
+                errors.extend(checkpoint.errors(COMPONENT, cid))
+        cids = [cid for cid in cids if cid not in done_cids]
+        logging.info(
+            f"Resuming with {len(cids)} of {ead.c_count()} components left."
+        )
 
+    incr_cache = None
+    validate_func = validate_component
+    extra_args = defaultdict(tuple)
+    if args.incremental:
+        incr_cache = IncrementalCache(
+            util.cache_file(args.cache_dir, "incremental", ead_file, html_dir),
+            salt=check_salt(config, permalink_index),
+        )
+        todo = set(cids)
+        elems = {
+            c.get("id"): c for c in ead.root.xpath("//c") if c.get("id") in todo
+        }
+        html_files = {
+            cid: comp_html_file(html_dir, comp_dirs[cid]) for cid in elems
+        }
+        reuse, cached = incr_cache.plan(elems, html_files)
+        for cid in cids:
+            if cid in reuse:
+                errors.extend(reuse[cid])
+                if checkpoint:
+                    checkpoint.add(COMPONENT, cid, reuse[cid])
+        cids = [cid for cid in cids if cid in cached]
+        validate_func = validate_component_incremental
+        extra_args = {cid: (cached[cid],) for cid in cids}
+
+    rss_summary = None
+
+    global records
+    records = None
+    if args.shared_records and cids and not (errors and args.exit_on_error):
+        records_start = time.time()
+        records = RecordStore.create(
+            {cid: load_component_values(cid, config) for cid in cids}
+        )
+        logging.info(
+            f"Shared {len(cids)} component records in"
+            f" {records.shm.size / 2**20:.1f} MB, taking"
+            f" {time.time() - records_start:.2f} seconds."
+        )
+
+    def add_result(cid, result) -> List[dict]:
+        if incr_cache:
+            result, html_hash = result
+        comp_file = comp_html_file(html_dir, comp_dirs[cid])
+        result = [
+            expand_record(record, ead_file, comp_file, config)
+            for record in result
+        ]
+        if incr_cache:
+            incr_cache.update(
+                cid,
+                cached[cid]["ead_hash"],
+                html_files[cid],
+                html_hash,
+                result,
+            )
+        errors.extend(result)
+        if checkpoint:
+            checkpoint.add(COMPONENT, cid, result)
+        return result
+
+    def add_results(results) -> bool:
+        # Returns whether to stop on the first error.
+        for cid, ok, result in results:
+            if ok:
+                result = add_result(cid, result)
+            else:
+                logging.error(f"{cid} failed with exception: {result}")
+                # Not checkpointed or cached so that it's retried.
+                result = [failed_record(cid, result)]
+                errors.extend(result)
+            if result and args.exit_on_error:
+                return True
+        return False
+
+    comp_start = time.time()
+    stopped = False
+    if errors and args.exit_on_error:
+        logging.info("Stopping on first error, skipping component checks.")
+        stopped = True
+        comp_start = None
+    elif args.multiprocessing or args.threading:
+        num_cpus = worker_budget(args)
         if args.multiprocessing:
-            exec_class_name = "ProcessPoolExecutor"
-            exec_args = {
-                "mp_context": get_context("fork"),  # needed for Macs
-                "max_workers": num_cpus,
-            }
-            manager = Manager()
-            lock = manager.Lock()
+            max_workers = args.workers or num_cpus
         else:
-            exec_class_name = "ThreadPoolExecutor"
-            exec_args = {"max_workers": min(32, num_cpus + 4)}
-            lock = threading.Lock()
+            max_workers = args.workers or min(32, num_cpus + 4)
+
+        # A forked worker gets the locks held by the parent's other threads
+        # at the time, which nothing in the worker ever releases. The top
+        # level threads only start after the first workers, later
+        # generations wait for them, but background phases and prefetch
+        # threads may be running whenever workers are replaced.
+        start_method = args.start_method
+        if (
+            args.multiprocessing
+            and start_method == "fork"
+            and (
+                args.prefetch
+                or not all(phases.done(name) for name in background)
+            )
+        ):
+            logging.info(
+                "Starting workers with forkserver while other threads are"
+                " running."
+            )
+            start_method = "forkserver"
 
+        # Stopping on the first error still waits for the running tasks, so
+        # those only check one component each.
+        if args.exit_on_error and not args.chunk_size:
+            chunk_size = 1
+        else:
+            chunk_size = args.chunk_size or default_chunk_size(
+                len(cids), max_workers
+            )
+        # Group components by contents page so that a chunk mostly needs
+        # a single page.
+        ordered = sorted(cids, key=lambda cid: (comp_dirs[cid], cid))
+        chunks = [
+            [
+                (cid, comp_dirs[cid], extra_args[cid])
+                for cid in ordered[i : i + chunk_size]
+            ]
+            for i in range(0, len(ordered), chunk_size)
+        ]
         logging.info(
-            f"Using {exec_args['max_workers']} max workers for"
-            f" {exec_class_name}."
+            f"Submitting {len(chunks)} tasks of up to {chunk_size}"
+            " components."
         )
 
-        exec_class = globals()[exec_class_name]
-
-        with exec_class(**exec_args) as executor:
-            tasks = {
-                executor.submit(
-                    validate_component,
-                    cid,
-                    comp_dirs[cid],
-                    config,
-                    html_dir,
-                    lock,
-                ): cid
-                for cid in sorted(ead.all_component_ids())
+        state = None
+        if args.multiprocessing and start_method != "fork":
+            state = {
+                "ead_file": ead_file,
+                "log_level": logging.getLogger().level,
+                "records": records.name if records else None,
+                "permalinks": permalink_index,
+                "archives": archive.mounted(),
             }
+        pool, prefetcher = start_workers(
+            args,
+            max_workers,
+            start_method,
+            chunks,
+            (validate_func, config, html_dir),
+            state,
+        )
 
-            for future in as_completed(tasks):
-                cid = tasks[future]
-                result = None
-                try:
-                    # print(f"future: {future}")
-                    # print(f"component id: {cid}")
-                    result = future.result()
-                except SystemExit as e:
-                    print(f"{cid} exited with value: {e}")
-                except Exception as e:
-                    print(f"{cid} failed with exception: {e}")
-                else:
-                    errors.extend(result)
-
-                if result or result is None:
-                    break
+        def before_generation() -> bool:
+            # Recycled or broken pools are replaced by a new generation of
+            # workers that runs the tasks the old one didn't finish.
+            if start_method == "fork" and top.tasks:
+                logging.info("Waiting for top level checks before forking.")
+                return top.wait(args.exit_on_error)
+            return False
+
+        stopped = pool.run(
+            lambda i, results: add_results(results),
+            side=top.tasks,
+            on_side=lambda name, future: bool(
+                top.add(name, future.result) and args.exit_on_error
+            ),
+            before_generation=before_generation,
+            after_submit=top.start if top_pool else None,
+        )
+        if prefetcher:
+            prefetcher.close()
+        rss_summary = log_pool_stats(pool, max_workers, args, prefetcher)
     else:
         from contextlib import nullcontext
         dummy_lock = nullcontext()
 
-        for cid in sorted(ead.all_component_ids()):
-            result = validate_component(
-                cid, comp_dirs[cid], config, html_dir, dummy_lock
+        for cid in cids:
+            result = validate_func(
+                cid,
+                comp_dirs[cid],
+                config,
+                html_dir,
+                dummy_lock,
+                *extra_args[cid],
+            )
+            if add_result(cid, result) and args.exit_on_error:
+                stopped = True
+                break
+
+    if cids and comp_start:
+        phases.record("component checks", comp_start, time.time())
+
+    if top_pool:
+        stopped = top.finish(stopped, args.exit_on_error)
+        if top.start_time:
+            phases.record("top level checks", top.start_time, time.time())
+
+    if stopped:
+        if phase_pool:
+            cancel_pending(phase_pool)
+        phases.close()
+    else:
+        unfinished = [name for name in background if not phases.done(name)]
+        if unfinished:
+            logging.info(f"Waiting for {', '.join(unfinished)} to finish.")
+        # A failed background phase doesn't undo the checks that ran.
+        for name, e in phases.join().items():
+            logging.error(f"Phase {name} failed: {e!r}")
+            errors.add(
+                expand_record(
+                    {
+                        "kind": "message",
+                        "scope": TOP_LEVEL,
+                        "cid": None,
+                        "message": f"Phase {name} failed with exception: {e!r}",
+                    },
+                    ead_file,
+                    None,
+                    config,
+                )
             )
-            errors.extend(result)
 
-    end_time = time.time()
-    duration = util.format_duration(end_time - start_time)
+    if top.times:
+        slowest = sorted(top.times.items(), key=lambda item: -item[1])
+        logging.info(
+            "Top level check times: "
+            + ", ".join(f"{name} {secs:.2f}s" for name, secs in slowest)
+        )
+    if checkpoint and top.times and not (top.incomplete or top.tasks):
+        checkpoint.add(TOP_LEVEL, None, top.records)
+
+    handle_resolver.close()
+
+    if records:
+        records.close()
+
+    if checkpoint:
+        checkpoint.close()
+
+    if incr_cache:
+        incr_cache.save(set(ead.all_component_ids()))
+
+    errors.close()
+    logging.info(f"Check results saved to {results_file}")
 
     if errors:
-        p.num(len(errors))
-        print(f"There {p.plural_verb('is')} {p.no('error')}.")
-        for error in errors:
-            print(f"ERROR: {error}\n")
+        print_summary(len(errors), results_file)
+
+    if manifest:
+        manifest.save(passed=not errors)
+
+    # Taken once everything the interpreter would wait for at exit is done.
+    end_time = time.time()
+    duration = util.format_duration(end_time - start_time)
 
     print_method = print if args.duration else logging.info
+    if rss_summary:
+        print_method(rss_summary)
+    print_method("Phase timeline:\n" + "\n".join(phases.timeline()))
+    if args.exit_on_error and errors.first_error_time is not None:
+        print_method(
+            "Time to first error:"
+            f" {errors.first_error_time - start_time:.2f} seconds, wall"
+            f" time: {end_time - start_time:.2f} seconds"
+        )
     print_method(f"Validation complete in {duration}")
     exit(1 if errors else 0)
 
@@ -1,3 +1,4 @@
+from .checkpoint import Checkpoint, CheckpointMismatchError
 from .component import Component
 from .ead import Ead
 from .eadhtml import EADHTML, ComponentNotFoundError
@@ -0,0 +1,204 @@
+from lxml import etree as ET
+from typing import BinaryIO, Dict, List, Tuple
+import gzip
+import hashlib
+import io
+import json
+import logging
+import os
+import shutil
+import tarfile
+import threading
+import zipfile
+
+ARCHIVE_EXTS = (".tar", ".tar.gz", ".tgz", ".zip")
+
+# Archives whose members are read through open_input, by archive path.
+mounts = {}
+
+
+def find_member(path) -> Tuple["Archive", str]:
+    for archive_path, archive in mounts.items():
+        if path.startswith(archive_path + "/"):
+            return archive, path[len(archive_path) + 1 :]
+    return None, None
+
+
+def is_archive(path) -> bool:
+    return path.endswith(ARCHIVE_EXTS) and os.path.isfile(path)
+
+
+def mount(path, spool_dir=None) -> "Archive":
+    if path not in mounts:
+        mounts[path] = Archive(path, spool_dir)
+    return mounts[path]
+
+
+def mounted() -> List[Tuple[str, str]]:
+    return [(archive.path, archive.spool_dir) for archive in mounts.values()]
+
+
+def open_input(path, mode="rb") -> BinaryIO:
+    """
+    Open a file for reading, which may be a member of a mounted archive
+    or gzip compressed. Text mode decodes like open() does.
+    """
+    archive, name = find_member(path)
+    if archive:
+        fh = io.BytesIO(archive.read(name))
+    elif path.endswith(".gz"):
+        fh = gzip.open(path, "rb")
+    else:
+        fh = open(path, "rb")
+    return io.TextIOWrapper(fh) if mode == "r" else fh
+
+
+def uncompressed_name(path) -> str:
+    return path[:-3] if path.endswith(".gz") else path
+
+
+def uncompressed_size(path) -> int:
+    if not path.endswith(".gz"):
+        return os.path.getsize(path)
+    # The gzip trailer ends with the uncompressed size modulo 2**32.
+    with open(path, "rb") as fh:
+        fh.seek(-4, os.SEEK_END)
+        return int.from_bytes(fh.read(4), "little")
+
+
+def parse_xml(path) -> ET._ElementTree:
+    if path.endswith(".gz") or find_member(path)[0]:
+        with open_input(path) as fh:
+            return ET.parse(fh)
+    return ET.parse(path)
+
+
+def read_source(source_file) -> list:
+    try:
+        with open(source_file) as fh:
+            return json.load(fh)
+    except (OSError, ValueError):
+        return None
+
+
+def remount(specs) -> None:
+    # Initializer for worker processes that weren't forked.
+    for path, spool_dir in specs:
+        mount(path, spool_dir)
+
+
+class Archive:
+    """
+    Random access to the files in a zip or tar archive. Zip files are
+    read through their central directory. Tar files are indexed by the
+    offset of each member's data, after streaming a compressed tar once
+    into an uncompressed copy under spool_dir. When the archive has a
+    single top directory, such as Hugo's public/, names are relative to
+    it.
+    """
+
+    def __init__(self, path, spool_dir=None):
+        self.path = path
+        self.spool_dir = spool_dir
+        self.local = threading.local()
+        self.offsets = {}
+        members = {}
+        if zipfile.is_zipfile(path):
+            self.kind = "zip"
+            with zipfile.ZipFile(path) as zf:
+                for info in zf.infolist():
+                    if not info.is_dir():
+                        members[info.filename] = (info.file_size, None)
+            # Zip times have no time zone, use the archive's.
+            mtime = os.stat(path).st_mtime_ns
+            members = {
+                name: (size, mtime) for name, (size, _) in members.items()
+            }
+        else:
+            self.kind = "tar"
+            self.tar_file = self._uncompressed(path)
+            with tarfile.open(self.tar_file, "r:") as tar:
+                for info in tar:
+                    if info.isfile():
+                        members[info.name] = (
+                            info.size,
+                            int(info.mtime * 10**9),
+                        )
+                        self.offsets[info.name] = (info.offset_data, info.size)
+            self.fd = os.open(self.tar_file, os.O_RDONLY)
+        self.names = {self._strip(name): name for name in members}
+        prefix = self._top_dir(self.names)
+        if prefix:
+            self.names = {
+                name[len(prefix) :]: member
+                for name, member in self.names.items()
+            }
+        self.members = {
+            name: members[member] for name, member in self.names.items()
+        }
+        logging.debug(
+            f"Indexed {len(self.members)} files in {self.kind} archive {path}"
+        )
+
+    @staticmethod
+    def _strip(name) -> str:
+        while name.startswith("./"):
+            name = name[2:]
+        return name.lstrip("/")
+
+    @staticmethod
+    def _top_dir(names) -> str:
+        tops = {name.split("/", 1)[0] for name in names}
+        if len(tops) == 1 and "index.html" not in names:
+            top = tops.pop()
+            if all(name.startswith(top + "/") for name in names):
+                return top + "/"
+        return None
+
+    def _uncompressed(self, path) -> str:
+        with open(path, "rb") as fh:
+            if fh.read(2) != b"\x1f\x8b":
+                return path
+        # One spool per archive path, replaced when the archive changes,
+        # with the size and mtime it was made from in a sidecar file.
+        st = os.stat(path)
+        source = [st.st_size, st.st_mtime_ns]
+        key = hashlib.sha1(os.path.abspath(path).encode()).hexdigest()
+        spool_dir = self.spool_dir or os.path.dirname(path)
+        os.makedirs(spool_dir, exist_ok=True)
+        tar_file = os.path.join(spool_dir, f"{key}.tar")
+        source_file = os.path.join(spool_dir, f"{key}.json")
+        if not os.path.isfile(tar_file) or read_source(source_file) != source:
+            logging.info(f"Decompressing {path} to {tar_file}")
+            tmp_file = f"{tar_file}.{os.getpid()}.tmp"
+            with gzip.open(path, "rb") as src, open(tmp_file, "wb") as dst:
+                shutil.copyfileobj(src, dst, 1 << 20)
+            os.replace(tmp_file, tar_file)
+            tmp_file = f"{source_file}.{os.getpid()}.tmp"
+            with open(tmp_file, "w") as fh:
+                json.dump(source, fh)
+            os.replace(tmp_file, source_file)
+        return tar_file
+
+    def _zip_file(self) -> zipfile.ZipFile:
+        # A ZipFile reads through a single file position under its own
+        # lock, so every thread and forked worker opens its own.
+        zf = getattr(self.local, "zip_file", None)
+        if zf is None or self.local.pid != os.getpid():
+            zf = self.local.zip_file = zipfile.ZipFile(self.path)
+            self.local.pid = os.getpid()
+        return zf
+
+    def read(self, name) -> bytes:
+        member = self.names.get(name)
+        if member is None:
+            raise FileNotFoundError(f"No file {name} in {self.path}")
+        if self.kind == "zip":
+            return self._zip_file().read(member)
+        # pread doesn't move the file position, threads and forked workers
+        # can share the descriptor.
+        offset, size = self.offsets[member]
+        return os.pread(self.fd, size, offset)
+
+    def stat(self) -> Dict[str, Tuple[int, int]]:
+        return self.members
@@ -0,0 +1,120 @@
+from typing import List
+import json
+import logging
+import os.path
+import time
+
+TOP_LEVEL = "top-level"
+COMPONENT = "component"
+
+
+class CheckpointMismatchError(Exception):
+    pass
+
+
+class Checkpoint:
+    def __init__(
+        self,
+        journal_file,
+        ead_file,
+        html_dir,
+        resume=False,
+        sync_every=100,
+        sync_interval=5.0,
+    ):
+        logging.debug(f"journal_file={journal_file}")
+        self.journal_file = journal_file
+        self.ead_file = ead_file
+        self.html_dir = html_dir
+        self.completed = {}
+        # fsync per record dominates short units, so sync in batches. A
+        # crash loses at most the last batch, which --resume reruns.
+        self.sync_every = sync_every
+        self.sync_interval = sync_interval
+        self.unsynced = 0
+        self.last_sync = time.monotonic()
+
+        if resume and os.path.isfile(journal_file):
+            self._load()
+            self.fh = open(journal_file, "a")
+        else:
+            self.fh = open(journal_file, "w")
+            self._write(
+                {"type": "header", "ead": ead_file, "html_dir": html_dir}
+            )
+
+    def _load(self) -> None:
+        with open(self.journal_file, "r+") as fh:
+            lines = fh.readlines()
+            if lines and not lines[-1].endswith("\n"):
+                # Drop the partial record left by a job killed mid-write
+                # so new records don't get appended onto it.
+                logging.warning(
+                    f"Truncating partial record at end of {self.journal_file}"
+                )
+                lines.pop()
+                fh.seek(0)
+                fh.truncate(sum(len(line.encode()) for line in lines))
+
+        for lineno, line in enumerate(lines, start=1):
+            try:
+                record = json.loads(line)
+            except json.JSONDecodeError:
+                logging.warning(
+                    f"Ignoring corrupt record at line {lineno} of"
+                    f" {self.journal_file}"
+                )
+                continue
+
+            if record["type"] == "header":
+                if (
+                    record["ead"] != self.ead_file
+                    or record["html_dir"] != self.html_dir
+                ):
+                    raise CheckpointMismatchError(
+                        f"Journal {self.journal_file} was written for"
+                        f" '{record['ead']}' and '{record['html_dir']}'"
+                    )
+            else:
+                self.completed[(record["type"], record["id"])] = record[
+                    "errors"
+                ]
+
+        logging.info(
+            f"Loaded {len(self.completed)} completed units from"
+            f" {self.journal_file}"
+        )
+
+    def _write(self, record) -> None:
+        self.fh.write(json.dumps(record) + "\n")
+        self.unsynced += 1
+        if (
+            self.unsynced >= self.sync_every
+            or time.monotonic() - self.last_sync >= self.sync_interval
+        ):
+            self.sync()
+
+    def sync(self) -> None:
+        self.fh.flush()
+        os.fsync(self.fh.fileno())
+        self.unsynced = 0
+        self.last_sync = time.monotonic()
+
+    def add(self, unit_type, unit_id, errors) -> None:
+        errors = list(errors or [])
+        self.completed[(unit_type, unit_id)] = errors
+        self._write({"type": unit_type, "id": unit_id, "errors": errors})
+
+    def close(self) -> None:
+        if self.unsynced:
+            self.sync()
+        self.fh.close()
+
+    def completed_ids(self, unit_type=COMPONENT) -> List[str]:
+        return [uid for utype, uid in self.completed if utype == unit_type]
+
+    def errors(self, unit_type, unit_id) -> List[str]:
+        return self.completed[(unit_type, unit_id)]
+
+    def is_done(self, unit_type, unit_id) -> bool:
+        return (unit_type, unit_id) in self.completed
@@ -1,5 +1,6 @@
 from __future__ import annotations
-from bs4 import BeautifulSoup, NavigableString, Tag
+from bs4 import NavigableString, Tag
+from ead_html_validator.permalinks import get_index
 from ead_html_validator.resultset import ResultSet
 from typing import List
 import ead_html_validator.util as util
@@ -446,15 +447,7 @@ class CompHTML:
         logging.trace(f"eadid: {eadid}")
         logging.trace(f"dirparts: {dirparts[2:]}")
 
-        html_file = os.path.join(html_dir, *dirparts[2:], "index.html")
-        logging.debug(f"permalink html file: {html_file}")
-        if not os.path.isfile(html_file):
-            return None
-        soup = BeautifulSoup(open(html_file), "html.parser")
-        link = soup.find(class_="dl-permalink")
-        if not link:
-            return None
-        url = link.contents[1].strip()
+        url = get_index(html_dir).lookup(os.path.join("", *dirparts[2:]))
         logging.debug(f"permalink for {link} is {url}")
         return url
 
@@ -1,5 +1,6 @@
 from __future__ import annotations
 from ead_html_validator.constants import LONGTEXT_XPATH
+from ead_html_validator.handles import resolve_handle
 from ead_html_validator.resultset import ResultSet
 import ead_html_validator.constants as cs
 import ead_html_validator.util as util
@@ -220,7 +221,7 @@ class Component:
                 url = link.get(href)
                 host = parse.urlsplit(url).netloc
                 if host == "hdl.handle.net":
-                    target = util.resolve_handle(url)
+                    target = resolve_handle(url)
                     logging.trace(f"dao link {url} resolves to {target}")
 
                 links.add(link.tag, url, link.sourceline)
@@ -1,4 +1,5 @@
 from collections import defaultdict
+from ead_html_validator import archive
 from ead_html_validator.component import Component
 from ead_html_validator.constants import LONGTEXT_XPATH
 from ead_html_validator.resultset import ResultSet
@@ -20,7 +21,7 @@ class Ead:
             "xlink": "http://www.w3.org/1999/xlink",
         }
 
-        self.tree = ET.parse(ead_file)
+        self.tree = archive.parse_xml(ead_file)
         logging.debug(self.tree)
 
         self.root = self.tree.getroot()
@@ -32,7 +33,10 @@ class Ead:
 
         ET.cleanup_namespaces(self.tree)
         if save_no_ns:
-            no_ns_file = os.path.splitext(ead_file)[0] + "-no-ns.xml"
+            no_ns_file = (
+                os.path.splitext(archive.uncompressed_name(ead_file))[0]
+                + "-no-ns.xml"
+            )
             self.tree.write(no_ns_file)
 
         logging.debug(self.root.tag)
@@ -1,4 +1,5 @@
 from bs4 import BeautifulSoup, NavigableString, Tag
+from ead_html_validator.archive import open_input
 from ead_html_validator.comphtml import CompHTML
 from ead_html_validator.resultset import ResultSet
 from lxml import etree as ET
@@ -17,12 +18,12 @@ class ComponentNotFoundError(Exception):
 
 
 class EADHTML:
-    def __init__(self, html_file, parser="html5lib"):
+    def __init__(self, html_file, parser="html5lib", markup=None):
         logging.debug(f"html_file={html_file}")
         logging.debug(f"html_parser={parser}")
-        self.soup = BeautifulSoup(
-            open(html_file), parser, multi_valued_attributes=None
-        )
+        if markup is None:
+            markup = open_input(html_file, "r")
+        self.soup = BeautifulSoup(markup, parser, multi_valued_attributes=None)
         self.dom = ET.HTML(str(self.soup))
         self.html_file = html_file
         self.main = self._main()
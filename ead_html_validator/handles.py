@@ -0,0 +1,124 @@
+from bs4 import BeautifulSoup
+from concurrent.futures import ThreadPoolExecutor
+from requests.adapters import HTTPAdapter
+from typing import Dict, Iterable
+import ead_html_validator.util as util
+import logging
+import os
+import requests
+import threading
+
+# Resolver used by resolve_handle, replaced with set_resolver.
+resolver = None
+
+
+def get_resolver() -> "HandleResolver":
+    global resolver
+    if resolver is None:
+        resolver = HandleResolver()
+    return resolver
+
+
+def resolve_handle(url) -> str:
+    return get_resolver().resolve(url)
+
+
+def set_resolver(new_resolver) -> None:
+    global resolver
+    resolver = new_resolver
+
+
+class HandleResolver:
+    """
+    Resolve handle URLs to their targets over a pooled requests session,
+    remembering the targets in memory and in cache_file between runs.
+    Offline, only cached handles resolve and the rest resolve to None.
+    """
+
+    def __init__(
+        self,
+        cache_file=None,
+        offline=False,
+        timeout=10.0,
+        num_threads=8,
+        session=None,
+    ):
+        self.cache_file = cache_file
+        self.offline = offline
+        self.timeout = timeout
+        self.num_threads = num_threads
+        self.targets = {}
+        if cache_file:
+            logging.debug(f"cache_file={cache_file}")
+            self.targets = util.load_json(cache_file, default={})
+        self.lock = threading.Lock()
+        self.num_resolved = 0
+        self.session = session or self._new_session()
+        self.pid = os.getpid()
+
+    def _new_session(self) -> requests.Session:
+        session = requests.Session()
+        adapter = HTTPAdapter(
+            pool_connections=self.num_threads, pool_maxsize=self.num_threads
+        )
+        session.mount("http://", adapter)
+        session.mount("https://", adapter)
+        return session
+
+    def _request(self, url) -> str:
+        if self.pid != os.getpid():
+            # Forked workers can't share the parent's open connections.
+            self.session = self._new_session()
+            self.pid = os.getpid()
+        response = self.session.get(
+            url, allow_redirects=False, timeout=self.timeout
+        )
+        target = response.headers.get("Location")
+        if not target:
+            soup = BeautifulSoup(response.text, "html.parser")
+            target = soup.a["href"]
+        with self.lock:
+            self.targets[url] = target
+            self.num_resolved += 1
+        return target
+
+    def close(self) -> None:
+        self.session.close()
+        self.save()
+
+    def resolve(self, url) -> str:
+        if url in self.targets:
+            return self.targets[url]
+        if self.offline:
+            logging.debug(f"Handle {url} isn't cached, not resolving offline")
+            return None
+        return self._request(url)
+
+    def resolve_all(self, urls: Iterable[str]) -> Dict[str, str]:
+        """
+        Resolve the distinct handles that aren't cached concurrently and
+        return the targets of all of them. Handles that fail to resolve
+        are logged and left out.
+        """
+        urls = set(urls)
+        todo = sorted(url for url in urls if url not in self.targets)
+        if todo and not self.offline:
+            logging.debug(f"Resolving {len(todo)} handles")
+            with ThreadPoolExecutor(
+                max_workers=self.num_threads, thread_name_prefix="handles"
+            ) as executor:
+                futures = {
+                    url: executor.submit(self._request, url) for url in todo
+                }
+            for url, future in futures.items():
+                try:
+                    future.result()
+                except Exception as e:
+                    logging.warning(f"Can't resolve handle {url}: {e!r}")
+        return {url: self.targets[url] for url in urls if url in self.targets}
+
+    def save(self) -> None:
+        if self.cache_file:
+            with self.lock:
+                targets = dict(self.targets)
+            util.save_json(self.cache_file, targets)
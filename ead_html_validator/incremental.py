@@ -0,0 +1,109 @@
+from lxml import etree as ET
+from typing import Dict, List, Tuple
+import ead_html_validator.util as util
+import logging
+
+
+def hash_subtree(elem, salt="") -> str:
+    return util.hash_bytes(salt.encode() + ET.tostring(elem, method="c14n"))
+
+
+def hash_fragment(tag) -> str:
+    return util.hash_bytes(str(tag).encode())
+
+
+class IncrementalCache:
+    def __init__(self, cache_file, salt=""):
+        logging.debug(f"cache_file={cache_file}")
+        self.cache_file = cache_file
+        # Mixed into the EAD hashes, so that the errors cached with another
+        # check config are stale.
+        self.salt = salt
+        self.entries = util.load_json(cache_file, default={})
+        self.updated = {}
+        self.file_hashes = {}
+
+    def file_hash(self, html_file) -> str:
+        if html_file not in self.file_hashes:
+            try:
+                self.file_hashes[html_file] = util.hash_file(html_file)
+            except OSError:
+                self.file_hashes[html_file] = None
+        return self.file_hashes[html_file]
+
+    def get(self, cid) -> dict:
+        return self.entries.get(cid)
+
+    def plan(
+        self, elems, html_files
+    ) -> Tuple[Dict[str, List[str]], Dict[str, dict]]:
+        """
+        Split components into ones whose cached errors can be reused and
+        ones to recheck. A component is rechecked if its EAD subtree or
+        its contents page changed, and so are its ancestors since their
+        nesting checks cover it.
+        """
+        ead_hashes = {
+            cid: hash_subtree(elem, self.salt) for cid, elem in elems.items()
+        }
+
+        dirty = set()
+        for cid, elem in elems.items():
+            entry = self.entries.get(cid)
+            if (
+                entry is None
+                or entry["ead_hash"] != ead_hashes[cid]
+                or entry["html_file"] != html_files[cid]
+                or entry["html_file_hash"] != self.file_hash(html_files[cid])
+            ):
+                dirty.add(cid)
+
+        forced = set()
+        for cid in dirty:
+            parent = elems[cid].getparent()
+            while parent is not None and parent.tag == "c":
+                forced.add(parent.get("id"))
+                parent = parent.getparent()
+
+        reuse = {}
+        recheck = {}
+        for cid in elems:
+            entry = self.entries.get(cid)
+            if cid not in dirty and cid not in forced:
+                reuse[cid] = entry["errors"]
+                self.updated[cid] = entry
+                continue
+            recheck[cid] = {"ead_hash": ead_hashes[cid]}
+            if (
+                cid not in forced
+                and entry
+                and entry["ead_hash"] == ead_hashes[cid]
+            ):
+                # Only the page changed, so the cached errors still hold
+                # if the component's own fragment is the same.
+                recheck[cid].update(
+                    html_hash=entry["html_hash"], errors=entry["errors"]
+                )
+
+        logging.info(
+            f"Incremental run: reusing {len(reuse)} and rechecking"
+            f" {len(recheck)} components ({len(dirty)} changed,"
+            f" {len(forced - dirty)} parents)."
+        )
+        return reuse, recheck
+
+    def save(self, cids) -> None:
+        entries = {
+            cid: entry for cid, entry in self.entries.items() if cid in cids
+        }
+        entries.update(self.updated)
+        util.save_json(self.cache_file, entries)
+
+    def update(self, cid, ead_hash, html_file, html_hash, errors) -> None:
+        self.updated[cid] = {
+            "ead_hash": ead_hash,
+            "html_file": html_file,
+            "html_file_hash": self.file_hash(html_file),
+            "html_hash": html_hash,
+            "errors": list(errors or []),
+        }
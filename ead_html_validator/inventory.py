@@ -0,0 +1,63 @@
+from ead_html_validator import archive
+from typing import Dict, List, Tuple
+import os
+import re
+
+
+class Inventory:
+    """
+    The files under a directory with their sizes and modification times,
+    from a single os.scandir walk, so that later phases don't have to
+    walk or stat the directory again. The root may also be a mounted
+    archive, listing its members.
+    """
+
+    def __init__(self, root, files):
+        self.root = root
+        self.files = files
+
+    @classmethod
+    def scan(cls, root) -> "Inventory":
+        if root in archive.mounts:
+            files = archive.mounts[root].stat()
+            return cls(
+                root,
+                {f"{root}/{name}": files[name] for name in sorted(files)},
+            )
+        files = {}
+        dirs = [root]
+        while dirs:
+            with os.scandir(dirs.pop()) as it:
+                for entry in it:
+                    if entry.is_dir(follow_symlinks=False):
+                        dirs.append(entry.path)
+                    elif entry.is_file():
+                        st = entry.stat()
+                        files[entry.path] = (st.st_size, st.st_mtime_ns)
+        return cls(root, dict(sorted(files.items())))
+
+    def exists(self, path) -> bool:
+        return path in self.files
+
+    def html_files(self) -> List[str]:
+        # Leave out the copies written by tidy.
+        return [
+            path for path in self.files if re.search(r"(?<!tidy)\.html$", path)
+        ]
+
+    def pages(self) -> Dict[str, str]:
+        # index.html files by directory, relative to the root.
+        return {
+            os.path.relpath(os.path.dirname(path), self.root): path
+            for path in self.files
+            if os.path.basename(path) == "index.html"
+        }
+
+    def size(self, path) -> int:
+        return self.files[path][0]
+
+    def stat(self, path) -> Tuple[int, int]:
+        return self.files[path]
+
+    def total_size(self) -> int:
+        return sum(size for size, mtime in self.files.values())
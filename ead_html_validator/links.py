@@ -0,0 +1,225 @@
+from collections import defaultdict
+from concurrent.futures import ThreadPoolExecutor
+from ead_html_validator import archive
+from lxml import etree as ET
+from requests.adapters import HTTPAdapter
+from typing import Dict, List, Set
+from urllib.parse import urlparse, urlsplit
+import asyncio
+import ead_html_validator.util as util
+import logging
+import requests
+import time
+
+# Some servers refuse or don't implement HEAD, so these are checked
+# again with GET.
+HEAD_NOT_SUPPORTED = {400, 403, 405, 501}
+
+# Statuses that say nothing lasting about the link, not cached.
+TRANSIENT_STATUSES = {408, 425, 429, 500, 502, 503, 504}
+
+
+def get_links(html_file, blocksize=1 << 16) -> List[str]:
+    # Stream the file through the parser without building a tree.
+    collector = LinkCollector()
+    parser = ET.HTMLParser(target=collector)
+    with archive.open_input(html_file) as fh:
+        for block in iter(lambda: fh.read(blocksize), b""):
+            parser.feed(block)
+    try:
+        return parser.close()
+    except ET.XMLSyntaxError as e:
+        # An empty page has nothing to parse.
+        logging.warning(f"Can't parse {html_file} for links: {e}")
+        return []
+
+
+def harvest_links(html_files, jobs=1, executor=None) -> Dict[str, Set[str]]:
+    """
+    Collect the links of all HTML files, in the process pool executor of
+    jobs workers when given, returning the files each distinct link is
+    found in.
+    """
+    links = defaultdict(set)
+    if executor and len(html_files) > 1:
+        chunksize = max(1, len(html_files) // (jobs * 4))
+        file_links = list(
+            executor.map(get_links, html_files, chunksize=chunksize)
+        )
+    else:
+        file_links = map(get_links, html_files)
+    for html_file, urls in zip(html_files, file_links):
+        for url in urls:
+            links[url].add(html_file)
+    return links
+
+
+def is_broken(result) -> bool:
+    return result["error"] is not None or (
+        result["status"] >= 400 and result["status"] not in TRANSIENT_STATUSES
+    )
+
+
+class LinkCollector:
+    """
+    lxml parser target collecting the href of every <a> and resolving
+    paths against the host of the canonical link.
+    """
+
+    def __init__(self):
+        self.hrefs = []
+        self.canonical = None
+
+    def close(self) -> List[str]:
+        base_url = None
+        if self.canonical:
+            url = urlparse(self.canonical)
+            base_url = f"{url.scheme}://{url.netloc}"
+        links = set()
+        for link in self.hrefs:
+            if link.startswith("#"):
+                continue
+            no_host = link.startswith("/")
+            if no_host and base_url:
+                link = f"{base_url}{link}"
+            elif no_host:
+                continue
+            links.add(link)
+        return list(links)
+
+    def data(self, data) -> None:
+        pass
+
+    def end(self, tag) -> None:
+        pass
+
+    def start(self, tag, attrib) -> None:
+        if tag == "a" and "href" in attrib:
+            self.hrefs.append(attrib["href"])
+        elif (
+            tag == "link"
+            and self.canonical is None
+            and "canonical" in attrib.get("rel", "").split()
+        ):
+            self.canonical = attrib.get("href")
+
+
+class LinkChecker:
+    """
+    Check URLs with asyncio over a shared requests session, so that
+    connections to a host are kept alive and reused. At most host_limit
+    requests go to a host at a time and at most host_rate per second,
+    HEAD falls back to GET and every request has a timeout. Statuses are
+    cached for ttl seconds in cache_file.
+    """
+
+    def __init__(
+        self,
+        cache_file=None,
+        ttl=24 * 3600,
+        timeout=10.0,
+        host_limit=4,
+        host_rate=None,
+        num_threads=16,
+        max_redirects=10,
+        session=None,
+    ):
+        self.cache_file = cache_file
+        self.ttl = ttl
+        self.timeout = timeout
+        self.host_limit = host_limit
+        self.host_rate = host_rate
+        self.num_threads = num_threads
+        self.entries = {}
+        if cache_file:
+            logging.debug(f"cache_file={cache_file}")
+            self.entries = util.load_json(cache_file, default={})
+        self.hits = 0
+        self.session = session or requests.Session()
+        self.session.max_redirects = max_redirects
+        adapter = HTTPAdapter(
+            pool_connections=num_threads, pool_maxsize=num_threads
+        )
+        self.session.mount("http://", adapter)
+        self.session.mount("https://", adapter)
+
+    async def _check(self, url, loop, executor, limits, next_start) -> dict:
+        host = urlsplit(url).netloc
+        async with limits[host]:
+            if self.host_rate:
+                # Space out request starts to the host.
+                now = time.monotonic()
+                start = max(now, next_start[host])
+                next_start[host] = start + 1 / self.host_rate
+                await asyncio.sleep(start - now)
+            return await loop.run_in_executor(executor, self._request, url)
+
+    async def _check_all(self, urls) -> List[dict]:
+        loop = asyncio.get_running_loop()
+        limits = defaultdict(lambda: asyncio.Semaphore(self.host_limit))
+        next_start = defaultdict(float)
+        with ThreadPoolExecutor(
+            max_workers=self.num_threads, thread_name_prefix="links"
+        ) as executor:
+            return await asyncio.gather(
+                *[
+                    self._check(url, loop, executor, limits, next_start)
+                    for url in urls
+                ]
+            )
+
+    def _request(self, url) -> dict:
+        result = {"status": None, "error": None, "checked": time.time()}
+        try:
+            response = self.session.head(
+                url, timeout=self.timeout, allow_redirects=True
+            )
+            if response.status_code in HEAD_NOT_SUPPORTED:
+                response = self.session.get(
+                    url, timeout=self.timeout, allow_redirects=True, stream=True
+                )
+                response.close()
+            result["status"] = response.status_code
+        except requests.RequestException as e:
+            result["error"] = repr(e)
+        logging.debug(f"{url}: {result}")
+        return result
+
+    def check(self, urls) -> Dict[str, dict]:
+        """
+        Return the status or error of each URL, from the cache while it's
+        fresh and by requesting it otherwise.
+        """
+        results = {}
+        todo = []
+        now = time.time()
+        for url in urls:
+            entry = self.entries.get(url)
+            if entry and now - entry["checked"] < self.ttl:
+                results[url] = entry
+                self.hits += 1
+            else:
+                todo.append(url)
+        logging.debug(f"Checking {len(todo)} links, {self.hits} cached")
+        if todo:
+            for url, result in zip(todo, asyncio.run(self._check_all(todo))):
+                results[url] = result
+                if result["error"] is None and (
+                    result["status"] not in TRANSIENT_STATUSES
+                ):
+                    self.entries[url] = result
+        return results
+
+    def close(self) -> None:
+        self.session.close()
+        if not self.cache_file:
+            return
+        now = time.time()
+        util.save_json(
+            self.cache_file,
+            {
+                url: entry
+                for url, entry in self.entries.items()
+                if now - entry["checked"] < self.ttl
+            },
+        )
@@ -0,0 +1,84 @@
+from concurrent.futures import ThreadPoolExecutor
+from typing import Dict, List
+import ead_html_validator.util as util
+import logging
+import os.path
+
+
+class Manifest:
+    def __init__(
+        self,
+        manifest_file,
+        ead_file,
+        html_dir,
+        extra_files=None,
+        inventory=None,
+    ):
+        logging.debug(f"manifest_file={manifest_file}")
+        self.manifest_file = manifest_file
+        self.ead_file = ead_file
+        self.html_dir = html_dir
+        self.extra_files = extra_files or []
+        self.inventory = inventory
+        data = util.load_json(manifest_file, default={})
+        self.previous = data.get("last", {})
+        self.passed = data.get("passed")
+        self.entries = {}
+
+    def build(self, max_workers=8) -> Dict[str, dict]:
+        files = [self.ead_file] + self.extra_files + self.html_files()
+
+        to_hash = []
+        for path in files:
+            if self.inventory and self.inventory.exists(path):
+                size, mtime = self.inventory.stat(path)
+            else:
+                st = os.stat(path)
+                size, mtime = st.st_size, st.st_mtime_ns
+            entry = {"size": size, "mtime": mtime}
+            prev = self.previous.get(path)
+            if (
+                prev
+                and prev["size"] == entry["size"]
+                and prev["mtime"] == entry["mtime"]
+            ):
+                entry["hash"] = prev["hash"]
+            else:
+                to_hash.append(path)
+            self.entries[path] = entry
+
+        logging.info(
+            f"Manifest has {len(files)} files, hashing {len(to_hash)}"
+            " new or modified ones."
+        )
+        with ThreadPoolExecutor(max_workers=max_workers) as executor:
+            for path, digest in zip(
+                to_hash, executor.map(util.hash_file, to_hash)
+            ):
+                self.entries[path]["hash"] = digest
+
+        return self.entries
+
+    def html_files(self) -> List[str]:
+        if self.inventory:
+            return sorted(self.inventory.pages().values())
+        html_files = []
+        for root, dirs, files in os.walk(self.html_dir):
+            if "index.html" in files:
+                html_files.append(os.path.join(root, "index.html"))
+        return sorted(html_files)
+
+    def hashes(self, entries) -> Dict[str, str]:
+        return {path: entry["hash"] for path, entry in entries.items()}
+
+    def is_unchanged(self) -> bool:
+        return bool(self.passed) and self.hashes(self.passed) == self.hashes(
+            self.entries
+        )
+
+    def save(self, passed=False) -> None:
+        data = {
+            "last": self.entries,
+            "passed": self.entries if passed else self.passed,
+        }
+        util.save_json(self.manifest_file, data)
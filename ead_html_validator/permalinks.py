@@ -0,0 +1,125 @@
+from ead_html_validator import archive
+from ead_html_validator.inventory import Inventory
+from lxml import etree as ET
+import ead_html_validator.util as util
+import json
+import logging
+import os
+
+PERMALINK_CLASS = "dl-permalink"
+
+# Permalink indexes by HTML directory, built on first use unless set with
+# set_index.
+indexes = {}
+
+
+def get_index(html_dir) -> "PermalinkIndex":
+    if html_dir not in indexes:
+        indexes[html_dir] = PermalinkIndex.build(html_dir)
+    return indexes[html_dir]
+
+
+def read_permalink(html_file) -> str:
+    with archive.open_input(html_file) as fh:
+        markup = fh.read()
+    # Most pages have no permalink, don't parse those.
+    if PERMALINK_CLASS.encode() not in markup:
+        return None
+    root = ET.fromstring(markup, ET.HTMLParser())
+    elems = root.xpath(
+        f"//*[contains(concat(' ', normalize-space(@class), ' '),"
+        f" ' {PERMALINK_CLASS} ')]"
+    )
+    if not elems:
+        return None
+    # The URL is the text after the label, the second child node.
+    elem = elems[0]
+    nodes = [elem.text] if elem.text else []
+    for child in elem:
+        nodes.append(child)
+        if child.tail:
+            nodes.append(child.tail)
+    if len(nodes) < 2 or not isinstance(nodes[1], str):
+        return None
+    return nodes[1].strip()
+
+
+def set_index(index) -> None:
+    indexes[index.html_dir] = index
+
+
+class PermalinkIndex:
+    """
+    The permalinks of the pages of a finding aid by page directory,
+    relative to the HTML directory.
+    """
+
+    def __init__(self, html_dir, permalinks):
+        self.html_dir = html_dir
+        self.permalinks = permalinks
+
+    @classmethod
+    def build(
+        cls, html_dir, jobs=1, cache_file=None, executor=None, inventory=None
+    ) -> "PermalinkIndex":
+        """
+        Read the permalink of every page, in the process pool executor of
+        jobs workers when given. Pages whose size and modification time
+        haven't changed since the permalinks were cached in cache_file
+        aren't read again.
+        """
+        inventory = inventory or Inventory.scan(html_dir)
+        pages = inventory.pages()
+        cached = {}
+        if cache_file:
+            logging.debug(f"cache_file={cache_file}")
+            cached = util.load_json(cache_file, default={})
+        stats = {}
+        permalinks = {}
+        todo = []
+        for page_dir, html_file in pages.items():
+            stats[page_dir] = list(inventory.stat(html_file))
+            entry = cached.get(page_dir)
+            if isinstance(entry, list) and entry[:2] == stats[page_dir]:
+                permalinks[page_dir] = entry[2]
+            else:
+                todo.append(page_dir)
+        logging.debug(
+            f"Reading permalinks of {len(todo)} pages,"
+            f" {len(pages) - len(todo)} cached"
+        )
+
+        files = [pages[page_dir] for page_dir in todo]
+        if executor and len(files) > 1:
+            chunksize = max(1, len(files) // (jobs * 4))
+            results = list(
+                executor.map(read_permalink, files, chunksize=chunksize)
+            )
+        else:
+            results = list(map(read_permalink, files))
+        permalinks.update(zip(todo, results))
+
+        if cache_file:
+            util.save_json(
+                cache_file,
+                {
+                    page_dir: stats[page_dir] + [permalinks[page_dir]]
+                    for page_dir in pages
+                },
+            )
+        return cls(
+            html_dir,
+            {
+                page_dir: permalink
+                for page_dir, permalink in permalinks.items()
+                if permalink
+            },
+        )
+
+    def digest(self) -> str:
+        return util.hash_bytes(
+            json.dumps(self.permalinks, sort_keys=True).encode()
+        )
+
+    def lookup(self, page_dir) -> str:
+        return self.permalinks.get(os.path.normpath(page_dir))
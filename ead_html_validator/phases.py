@@ -0,0 +1,142 @@
+from concurrent.futures import Future, ThreadPoolExecutor, wait
+from typing import Dict, List
+import logging
+import threading
+import time
+
+
+class PhaseGraph:
+    """
+    Run named phases in a thread pool, each one as soon as the phases it
+    depends on have finished and a thread is free, higher priority phases
+    first, and record when each phase ran so that the run can be shown as
+    a timeline. Phases run by the caller can be added to the timeline with
+    record().
+    """
+
+    def __init__(self, num_threads):
+        self.num_threads = num_threads
+        self.executor = ThreadPoolExecutor(
+            max_workers=num_threads, thread_name_prefix="phase"
+        )
+        self.lock = threading.Lock()
+        self.phases = {}
+        self.futures = {}
+        self.started = set()
+        self.running = 0
+        self.times = {}
+        self.start_time = None
+        self.closed = False
+
+    def _run(self, name) -> None:
+        func, deps, _ = self.phases[name]
+        future = self.futures[name]
+        failed = [dep for dep in deps if self.futures[dep].exception()]
+        if failed:
+            logging.debug(f"Skipping phase {name}, {failed[0]} failed")
+            future.set_exception(self.futures[failed[0]].exception())
+        else:
+            logging.debug(f"Starting phase {name}")
+            start = time.time()
+            try:
+                result = func()
+            except BaseException as e:
+                future.set_exception(e)
+            else:
+                future.set_result(result)
+            self.record(name, start, time.time())
+        with self.lock:
+            self.running -= 1
+        self._submit_ready()
+
+    def _submit_ready(self) -> None:
+        # Ready phases wait here rather than in the executor's queue, so
+        # that one becoming ready later can still go ahead of them.
+        with self.lock:
+            if self.closed:
+                return
+            ready = [
+                name
+                for name, (func, deps, priority) in self.phases.items()
+                if name not in self.started
+                and all(self.futures[dep].done() for dep in deps)
+            ]
+            ready.sort(key=lambda name: -self.phases[name][2])
+            for name in ready[: self.num_threads - self.running]:
+                self.started.add(name)
+                self.running += 1
+                self.executor.submit(self._run, name)
+
+    def add(self, name, func, deps=(), priority=0) -> None:
+        for dep in deps:
+            if dep not in self.phases:
+                raise ValueError(f"Phase {name} depends on unknown {dep}")
+        self.phases[name] = (func, list(deps), priority)
+        self.futures[name] = Future()
+
+    def close(self) -> None:
+        # Phases already running finish, the rest are never started.
+        with self.lock:
+            self.closed = True
+        self.executor.shutdown()
+
+    def done(self, name) -> bool:
+        return self.futures[name].done()
+
+    def has(self, name) -> bool:
+        return name in self.phases
+
+    def join(self) -> Dict[str, BaseException]:
+        # Returns the exceptions of the phases that failed, the other
+        # phases still ran to the end.
+        wait(list(self.futures.values()))
+        self.executor.shutdown()
+        return {
+            name: future.exception()
+            for name, future in self.futures.items()
+            if future.exception()
+        }
+
+    def record(self, name, start, end) -> None:
+        self.times[name] = (start, end)
+
+    def result(self, name) -> object:
+        return self.futures[name].result()
+
+    def start(self) -> None:
+        self.start_time = time.time()
+        self._submit_ready()
+
+    def when_done(self, names, func) -> None:
+        # Call func once all the named phases have finished or failed.
+        remaining = [len(names)]
+
+        def on_done(future) -> None:
+            with self.lock:
+                remaining[0] -= 1
+                last = remaining[0] == 0
+            if last:
+                func()
+
+        for name in names:
+            self.futures[name].add_done_callback(on_done)
+
+    def timeline(self, width=40) -> List[str]:
+        if not self.times:
+            return []
+        total = max(end for _, end in self.times.values()) - self.start_time
+        scale = width / total if total > 0 else 0
+        name_width = max(map(len, self.times))
+        lines = []
+        for name, (start, end) in sorted(
+            self.times.items(), key=lambda item: item[1]
+        ):
+            offset = start - self.start_time
+            first = min(width - 1, int(offset * scale))
+            last = max(first + 1, round((end - self.start_time) * scale))
+            bar = " " * first + "#" * (last - first)
+            lines.append(
+                f"{name:<{name_width}} {offset:7.2f}s {end - start:7.2f}s"
+                f" |{bar:<{width}}|"
+            )
+        return lines
@@ -0,0 +1,234 @@
+from collections import defaultdict, deque
+from concurrent.futures import FIRST_COMPLETED, wait
+from concurrent.futures.process import BrokenProcessPool
+from itertools import islice
+from typing import Callable, Dict, List, Tuple
+import logging
+import sys
+import time
+
+# Times a task is resubmitted after the worker process running it died.
+MAX_TASK_RETRIES = 2
+
+
+def cancel_pending(executor, tasks=()) -> int:
+    # Running tasks can't be cancelled, they finish and their results are
+    # dropped. They're waited for here rather than when the interpreter
+    # exits, so that the reported run time includes them.
+    num_cancelled = sum(future.cancel() for future in tasks)
+    if sys.version_info >= (3, 9):
+        executor.shutdown(cancel_futures=True)
+    else:
+        executor.shutdown()
+    return num_cancelled
+
+
+def recycle_reason(stats, max_tasks, max_rss) -> str:
+    if max_tasks and stats["tasks"] >= max_tasks:
+        return f"worker {stats['pid']} ran {stats['tasks']} tasks"
+    if max_rss and stats["rss"] > max_rss:
+        return (
+            f"worker {stats['pid']} is using {stats['rss'] / 2**20:.0f} MB"
+            " RSS"
+        )
+    return None
+
+
+class TaskPool:
+    """
+    Run chunks of component checks on generations of workers, with at most
+    depth of them submitted at a time. A broken pool, or a worker that has
+    to be recycled, ends the generation and a new one runs the chunks the
+    old one didn't finish. Chunks running on a worker that died are retried
+    MAX_TASK_RETRIES times.
+
+    submit(executor, i, upcoming) submits chunk i, upcoming are the next
+    ones to be submitted. A chunk's future returns (results, start, end,
+    stats), where results are (cid, ok, result) tuples and stats has the
+    worker's pid, warmup, rss and tasks. in_flight has a flag per chunk
+    that the worker sets while running it, without it every chunk on a
+    broken pool counts as a failed attempt.
+    """
+
+    def __init__(
+        self,
+        chunks,
+        submit: Callable,
+        make_executor: Callable,
+        depth,
+        in_flight=None,
+        check_worker: Callable = None,
+    ):
+        self.chunks = chunks
+        self.submit = submit
+        self.make_executor = make_executor
+        self.depth = depth
+        self.in_flight = in_flight
+        self.check_worker = check_worker
+        self.attempts = defaultdict(int)
+        # Generations in a row whose workers died before finishing a task,
+        # like when the initializer fails.
+        self.barren = 0
+        self.num_done = 0
+        self.busy_time = 0.0
+        self.return_time = 0.0
+        self.results_time = 0.0
+        self.workers = {}
+        self.start_time = None
+
+    def _failed(self, i, e) -> List[tuple]:
+        chunk = self.chunks[i]
+        if not isinstance(e, BrokenProcessPool):
+            logging.error(
+                f"Task for {len(chunk)} components failed with exception:"
+                f" {e!r}"
+            )
+        return [(cid, False, repr(e)) for cid, _, _ in chunk]
+
+    def _generation(
+        self, queue, on_results, side, on_side, after_submit
+    ) -> Tuple[List[int], bool]:
+        # Returns the chunks left for the next generation and whether a
+        # callback asked to stop.
+        executor = self.make_executor()
+        recycle = None
+        requeue = []
+        waiting = deque(queue)
+        running = {}
+        gen_done = 0
+        stopped = False
+        try:
+            while running or (waiting and not recycle):
+                while waiting and not recycle and len(running) < self.depth:
+                    i = waiting.popleft()
+                    try:
+                        future = self.submit(
+                            executor, i, islice(waiting, self.depth)
+                        )
+                    except BrokenProcessPool:
+                        # The failed futures of the running tasks say which
+                        # worker died.
+                        waiting.appendleft(i)
+                        recycle = "a worker died"
+                        break
+                    running[future] = i
+                if after_submit:
+                    after_submit()
+
+                done, _ = wait(
+                    list(running) + list(side), return_when=FIRST_COMPLETED
+                )
+                results_start = time.time()
+                for future in done:
+                    if future in side:
+                        if on_side(side.pop(future), future):
+                            stopped = True
+                            break
+                        continue
+                    i = running.pop(future)
+                    try:
+                        results, task_start, task_end, stats = future.result()
+                    except BrokenProcessPool as e:
+                        # Nothing more can be submitted to the broken pool,
+                        # the next generation runs the rest.
+                        recycle = "a worker died"
+                        # Only tasks that were running count as failures,
+                        # the rest were just queued on the broken pool.
+                        if self.in_flight is None:
+                            self.attempts[i] += 1
+                        elif self.in_flight[i]:
+                            self.attempts[i] += 1
+                            self.in_flight[i] = 0
+                        if self.attempts[i] <= MAX_TASK_RETRIES:
+                            requeue.append(i)
+                            continue
+                        logging.error(
+                            f"Giving up on task for {len(self.chunks[i])}"
+                            f" components after {self.attempts[i]} worker"
+                            " failures."
+                        )
+                        results = self._failed(i, e)
+                    except Exception as e:
+                        results = self._failed(i, e)
+                    else:
+                        self.num_done += 1
+                        gen_done += 1
+                        self.busy_time += task_end - task_start
+                        self.return_time += time.time() - task_end
+                        worker = self.workers.setdefault(
+                            stats["pid"], {"warmup": stats["warmup"], "rss": []}
+                        )
+                        worker["rss"].append(stats["rss"])
+                        if self.check_worker and recycle is None:
+                            # Running tasks finish, the rest wait for fresh
+                            # workers.
+                            recycle = self.check_worker(stats)
+                            if recycle and waiting:
+                                logging.info(
+                                    f"Recycling all workers because {recycle},"
+                                    f" requeueing {len(waiting)} tasks."
+                                )
+
+                    if on_results(i, results):
+                        stopped = True
+                        break
+                self.results_time += time.time() - results_start
+
+                if stopped:
+                    num_cancelled = cancel_pending(executor, running)
+                    logging.info(
+                        "Stopping on first error, cancelled"
+                        f" {num_cancelled + len(waiting)} pending tasks."
+                    )
+                    break
+        finally:
+            executor.shutdown()
+
+        if requeue and not stopped:
+            logging.warning(
+                f"Worker process died, resubmitting {len(requeue)} tasks."
+            )
+        self.barren = self.barren + 1 if requeue and not gen_done else 0
+        requeue.extend(waiting)
+        return sorted(requeue), stopped
+
+    def run(
+        self,
+        on_results: Callable,
+        side: Dict = None,
+        on_side: Callable = None,
+        before_generation: Callable = None,
+        after_submit: Callable = None,
+    ) -> bool:
+        # Returns whether a callback asked to stop. on_results(i, results)
+        # gets the results of chunk i, also when it failed. The futures in
+        # side are waited for alongside the chunks, on_side(side[future],
+        # future) is called as each one finishes. before_generation() is
+        # called before the workers of a generation start, after_submit()
+        # once tasks were submitted to them.
+        self.start_time = time.time()
+        side = {} if side is None else side
+        queue = list(range(len(self.chunks)))
+        while queue:
+            if before_generation and before_generation():
+                return True
+            queue, stopped = self._generation(
+                queue, on_results, side, on_side, after_submit
+            )
+            if stopped:
+                return True
+            if self.barren > MAX_TASK_RETRIES:
+                logging.error(
+                    f"Giving up on {len(queue)} tasks after {self.barren}"
+                    " generations of workers died without finishing a task."
+                )
+                for i in queue:
+                    on_results(
+                        i,
+                        [
+                            (cid, False, "worker processes died")
+                            for cid, _, _ in self.chunks[i]
+                        ],
+                    )
+                queue = []
+        return False
@@ -0,0 +1,81 @@
+from concurrent.futures import ThreadPoolExecutor
+from ead_html_validator.archive import open_input
+from typing import Dict, Iterable, List, Tuple
+import logging
+import threading
+import time
+
+
+class Prefetcher:
+    """
+    Read the files needed by upcoming tasks in a small thread pool, in
+    the order the tasks are scheduled. Each file is read once however
+    many scheduled tasks need it and dropped when the last one takes it,
+    and at most depth tasks are read ahead.
+    """
+
+    def __init__(self, num_threads, depth):
+        self.num_threads = num_threads
+        self.depth = depth
+        self.executor = ThreadPoolExecutor(
+            max_workers=num_threads, thread_name_prefix="prefetch"
+        )
+        self.lock = threading.Lock()
+        self.files = {}
+        self.tasks = {}
+        self.busy_time = 0.0
+        self.wait_time = 0.0
+        self.num_files = 0
+        self.num_bytes = 0
+
+    def _read(self, filename) -> str:
+        start = time.monotonic()
+        with open_input(filename, "r") as fh:
+            markup = fh.read()
+        with self.lock:
+            self.busy_time += time.monotonic() - start
+            self.num_files += 1
+            self.num_bytes += len(markup)
+        return markup
+
+    def close(self) -> None:
+        for future, refs in self.files.values():
+            future.cancel()
+        self.executor.shutdown()
+        self.files = {}
+        self.tasks = {}
+
+    def fill(self, upcoming: Iterable[Tuple[object, List[str]]]) -> None:
+        for key, filenames in upcoming:
+            if len(self.tasks) >= self.depth:
+                break
+            if key not in self.tasks:
+                self.schedule(key, filenames)
+
+    def get(self, key, filenames) -> Dict[str, str]:
+        if key not in self.tasks:
+            self.schedule(key, filenames)
+        start = time.monotonic()
+        markup = {}
+        for filename in self.tasks.pop(key):
+            future, refs = self.files[filename]
+            try:
+                markup[filename] = future.result()
+            except OSError as e:
+                # Leave it to the worker to report.
+                logging.debug(f"Can't prefetch {filename}: {e}")
+            if refs == 1:
+                del self.files[filename]
+            else:
+                self.files[filename] = (future, refs - 1)
+        self.wait_time += time.monotonic() - start
+        return markup
+
+    def schedule(self, key, filenames) -> None:
+        for filename in filenames:
+            if filename in self.files:
+                future, refs = self.files[filename]
+            else:
+                future, refs = self.executor.submit(self._read, filename), 0
+            self.files[filename] = (future, refs + 1)
+        self.tasks[key] = filenames
@@ -0,0 +1,77 @@
+from ead_html_validator.snapshot import pack_value, unpack_value
+from typing import Dict
+import json
+import logging
+import struct
+
+# Length of the JSON index at the start of the block.
+HEADER = struct.Struct("<Q")
+
+
+class RecordStore:
+    """
+    Component values packed into a shared memory block so that worker
+    processes can read them without parsing the EAD. The block holds
+    the length of the index, a JSON index mapping component ids to the
+    offset and length of their record, then the JSON encoded records.
+    """
+
+    def __init__(self, shm, owner=False):
+        self.shm = shm
+        self.name = shm.name
+        self.owner = owner
+        (self.index_len,) = HEADER.unpack_from(shm.buf, 0)
+        self.index = json.loads(
+            bytes(shm.buf[HEADER.size : HEADER.size + self.index_len])
+        )
+
+    @classmethod
+    def attach(cls, name) -> "RecordStore":
+        from multiprocessing import shared_memory
+
+        return cls(shared_memory.SharedMemory(name=name))
+
+    @classmethod
+    def create(cls, records) -> "RecordStore":
+        from multiprocessing import shared_memory
+
+        index = {}
+        data = []
+        offset = 0
+        for cid, values in records.items():
+            record = json.dumps(
+                {name: pack_value(value) for name, value in values.items()}
+            ).encode()
+            index[cid] = (offset, len(record))
+            data.append(record)
+            offset += len(record)
+
+        index_data = json.dumps(index).encode()
+        start = HEADER.size + len(index_data)
+        shm = shared_memory.SharedMemory(create=True, size=start + offset)
+        HEADER.pack_into(shm.buf, 0, len(index_data))
+        shm.buf[HEADER.size : start] = index_data
+        for (pos, length), record in zip(index.values(), data):
+            shm.buf[start + pos : start + pos + length] = record
+
+        logging.debug(
+            f"Packed {len(index)} component records into {shm.size} bytes"
+            f" of shared memory '{shm.name}'"
+        )
+        return cls(shm, owner=True)
+
+    def close(self) -> None:
+        self.index = {}
+        self.shm.close()
+        if self.owner:
+            self.shm.unlink()
+
+    def get(self, cid) -> Dict[str, object]:
+        if cid not in self.index:
+            return None
+        offset, length = self.index[cid]
+        start = HEADER.size + self.index_len + offset
+        record = json.loads(bytes(self.shm.buf[start : start + length]))
+        return {
+            name: unpack_value(name, value) for name, value in record.items()
+        }
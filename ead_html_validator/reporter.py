@@ -0,0 +1,88 @@
+from collections import Counter
+import json
+import logging
+import sys
+import time
+
+
+class StreamRenderer:
+    def __init__(self, render, stream=None, flush_interval=2.0):
+        self.render = render
+        self.stream = stream or sys.stdout
+        self.flush_interval = flush_interval
+        self.last_flush = time.monotonic()
+
+    def close(self) -> None:
+        self.stream.flush()
+
+    def write(self, record) -> None:
+        self.stream.write(f"ERROR: {self.render(record)}\n\n")
+        now = time.monotonic()
+        if now - self.last_flush >= self.flush_interval:
+            self.stream.flush()
+            self.last_flush = now
+
+
+class Reporter:
+    def __init__(
+        self,
+        results_file,
+        ead_file,
+        html_dir,
+        renderers=None,
+        buffer_size=1 << 20,
+        flush_interval=10.0,
+    ):
+        logging.debug(f"results_file={results_file}")
+        self.results_file = results_file
+        self.renderers = renderers or []
+        self.flush_interval = flush_interval
+        self.last_flush = time.monotonic()
+        self.counts = Counter()
+        self.fields = Counter()
+        self.num_errors = 0
+        self.first_error_time = None
+        self.fh = open(results_file, "w", buffering=buffer_size)
+        self._write(
+            {
+                "type": "header",
+                "ead_file": ead_file,
+                "html_dir": html_dir,
+                "created": time.strftime("%Y-%m-%dT%H:%M:%S%z"),
+            }
+        )
+
+    def _write(self, record) -> None:
+        self.fh.write(json.dumps(record) + "\n")
+        now = time.monotonic()
+        if now - self.last_flush >= self.flush_interval:
+            self.fh.flush()
+            self.last_flush = now
+
+    def add(self, record) -> None:
+        self._write(dict(record, type="error"))
+        if self.first_error_time is None:
+            self.first_error_time = time.time()
+        self.num_errors += 1
+        self.counts[record["kind"]] += 1
+        if record.get("field"):
+            self.fields[record["field"]] += 1
+        for renderer in self.renderers:
+            renderer.write(record)
+
+    def close(self) -> None:
+        self.fh.close()
+        for renderer in self.renderers:
+            renderer.close()
+        logging.info(f"Errors by kind: {dict(self.counts)}")
+        logging.info(f"Errors by field: {dict(self.fields.most_common())}")
+
+    def extend(self, records) -> None:
+        for record in records:
+            self.add(record)
+
+    def __bool__(self) -> bool:
+        return self.num_errors > 0
+
+    def __len__(self) -> int:
+        return self.num_errors
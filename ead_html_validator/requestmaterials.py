@@ -1,4 +1,5 @@
 from bs4 import BeautifulSoup
+from ead_html_validator.archive import open_input
 from typing import List
 import re
 
@@ -6,7 +7,7 @@ import re
 class RequestMaterials:
     def __init__(self, html_file, parser="html5lib"):
         self.soup = BeautifulSoup(
-            open(html_file), parser, multi_valued_attributes=None
+            open_input(html_file, "r"), parser, multi_valued_attributes=None
         )
         self.html_file = html_file
 
@@ -0,0 +1,173 @@
+from typing import List, Set, Tuple
+import glob
+import math
+import os
+
+# Rough memory use of a worker before it loads any HTML and of the
+# parsed documents relative to their file size.
+BASE_WORKER_MEMORY = 64 * 2**20
+SOUP_SIZE_FACTOR = 10
+LXML_SIZE_FACTOR = 5
+
+# cgroup v1 reports "no limit" as a very large number.
+UNLIMITED = 2**60
+
+
+def affinity_cpus() -> int:
+    try:
+        return len(os.sched_getaffinity(0))  # Only works on Unix
+    except AttributeError:
+        return os.cpu_count() or 1
+
+
+def available_memory() -> int:
+    try:
+        with open("/proc/meminfo") as fh:
+            for line in fh:
+                if line.startswith("MemAvailable:"):
+                    return int(line.split()[1]) * 1024
+    except OSError:
+        pass
+    return None
+
+
+def cgroup_cpus() -> float:
+    value = read_first_line("/sys/fs/cgroup/cpu.max")
+    if value:
+        quota, period = value.split()
+        if quota != "max":
+            return int(quota) / int(period)
+        return None
+    quota = read_first_line("/sys/fs/cgroup/cpu/cpu.cfs_quota_us")
+    period = read_first_line("/sys/fs/cgroup/cpu/cpu.cfs_period_us")
+    if quota and period and int(quota) > 0:
+        return int(quota) / int(period)
+    return None
+
+
+def cgroup_memory() -> int:
+    for limit_file in [
+        "/sys/fs/cgroup/memory.max",
+        "/sys/fs/cgroup/memory/memory.limit_in_bytes",
+    ]:
+        value = read_first_line(limit_file)
+        if value:
+            if value == "max" or int(value) >= UNLIMITED:
+                return None
+            return int(value)
+    return None
+
+
+def estimate_worker_memory(html_sizes, cache_size) -> int:
+    # A worker holds up to cache_size parsed pages, so assume the worst
+    # case of the largest ones.
+    largest = sorted(html_sizes, reverse=True)[:cache_size]
+    return BASE_WORKER_MEMORY + SOUP_SIZE_FACTOR * sum(largest)
+
+
+def numa_nodes() -> List[Set[int]]:
+    nodes = []
+    for node_dir in sorted(glob.glob("/sys/devices/system/node/node[0-9]*")):
+        cpulist = read_first_line(os.path.join(node_dir, "cpulist"))
+        if cpulist:
+            nodes.append(parse_cpulist(cpulist))
+    return nodes
+
+
+def parse_cpulist(cpulist) -> Set[int]:
+    cpus = set()
+    for part in cpulist.split(","):
+        if "-" in part:
+            start, end = part.split("-")
+            cpus.update(range(int(start), int(end) + 1))
+        elif part:
+            cpus.add(int(part))
+    return cpus
+
+
+def pin_cpus(slot, mode) -> Set[int]:
+    """
+    Return the CPUs for the worker in the given slot, either a single
+    core or all cores of one NUMA node. Consecutive slots alternate
+    between NUMA nodes so that workers are spread across sockets.
+    """
+    allowed = os.sched_getaffinity(0)
+    nodes = [sorted(node & allowed) for node in numa_nodes()]
+    nodes = [node for node in nodes if node] or [sorted(allowed)]
+    if mode == "numa":
+        return set(nodes[slot % len(nodes)])
+    cores = [
+        node[i]
+        for i in range(max(len(node) for node in nodes))
+        for node in nodes
+        if i < len(node)
+    ]
+    return {cores[slot % len(cores)]}
+
+
+def plan_workers(
+    html_sizes, cache_size, ead_size, reserved=0
+) -> Tuple[str, int, List[str]]:
+    """
+    Pick the parallel mode and number of workers that fit the CPUs and
+    memory granted to the job by the cgroup, SLURM and the machine.
+    Returns the mode, the number of workers and the reasons.
+    """
+    cpus = affinity_cpus()
+    reasons = [f"{cpus} usable cpus"]
+    limit = cgroup_cpus()
+    if limit is not None and limit < cpus:
+        cpus = max(1, math.ceil(limit))
+        reasons.append(f"cgroup cpu quota {limit:g}")
+    slurm_cpus = os.environ.get("SLURM_CPUS_PER_TASK")
+    if slurm_cpus and int(slurm_cpus) < cpus:
+        cpus = int(slurm_cpus)
+        reasons.append(f"SLURM_CPUS_PER_TASK={slurm_cpus}")
+
+    memory = available_memory()
+    mem_source = "available memory"
+    limit = cgroup_memory()
+    if limit is not None and (memory is None or limit < memory):
+        memory, mem_source = limit, "cgroup memory limit"
+    slurm_mem = slurm_memory(cpus)
+    if slurm_mem is not None and (memory is None or slurm_mem < memory):
+        memory, mem_source = slurm_mem, "SLURM memory"
+
+    per_worker = estimate_worker_memory(html_sizes, cache_size)
+    if memory is None:
+        mem_workers = cpus
+    else:
+        budget = memory - reserved - LXML_SIZE_FACTOR * ead_size
+        mem_workers = max(0, budget // per_worker)
+        reasons.append(
+            f"{memory / 2**30:.1f} GB {mem_source} for workers of"
+            f" ~{per_worker / 2**20:.0f} MB"
+        )
+
+    if cpus < 2:
+        mode, num_workers = "serial", 1
+    elif mem_workers >= 2:
+        mode, num_workers = "multiprocessing", int(min(cpus, mem_workers))
+    else:
+        # Threads share one page cache, so they fit where processes don't.
+        mode, num_workers = "threading", cpus
+    return mode, num_workers, reasons
+
+
+def read_first_line(filename) -> str:
+    try:
+        with open(filename) as fh:
+            return fh.readline().strip()
+    except OSError:
+        return None
+
+
+def slurm_memory(cpus) -> int:
+    # SLURM gives memory in megabytes, either per node or per cpu.
+    mem_per_node = os.environ.get("SLURM_MEM_PER_NODE")
+    if mem_per_node:
+        return int(mem_per_node) * 2**20
+    mem_per_cpu = os.environ.get("SLURM_MEM_PER_CPU")
+    if mem_per_cpu:
+        return int(mem_per_cpu) * cpus * 2**20
+    return None
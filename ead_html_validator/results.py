@@ -0,0 +1,10 @@
+from typing import Iterator
+import json
+
+
+def read_results(results_file) -> Iterator[dict]:
+    with open(results_file) as fh:
+        for line in fh:
+            record = json.loads(line)
+            if record.pop("type") == "error":
+                yield record
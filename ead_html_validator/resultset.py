@@ -10,6 +10,8 @@ else:
 
 T = TypeVar("T")
 
+VALUE_TYPES = {"str": str, "dict": dict}
+
 
 class ResultSetIter:
     def __init__(self):
@@ -55,6 +57,15 @@ class ResultSet:
                 self.results_uniq[result["value"]].append(result["lineno"])
         return self
 
+    @classmethod
+    def from_dict(cls, data) -> Self:
+        result_set = cls(
+            value_type=VALUE_TYPES[data["value_type"]], xpath=data["xpath"]
+        )
+        for result in data["results"]:
+            result_set.add(result["tag"], result["value"], result["lineno"])
+        return result_set
+
     def first_value(self) -> Dict[str, T]:
         return self.results_list[0]
 
@@ -108,6 +119,13 @@ class ResultSet:
                 for result in self.results_list
             ]
 
+    def to_dict(self) -> dict:
+        return {
+            "value_type": self.value_type.__name__,
+            "xpath": self.xpath,
+            "results": self.results_list,
+        }
+
     def type(self) -> Type[T]:
         return self.value_type
 
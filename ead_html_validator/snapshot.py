@@ -0,0 +1,106 @@
+from ead_html_validator.resultset import ResultSet
+from typing import Dict
+import ead_html_validator.util as util
+import json
+import logging
+import os
+import sqlite3
+import threading
+
+# Bump when Component or CompHTML extraction changes so stale
+# snapshots are no longer matched.
+SNAPSHOT_VERSION = 1
+
+LEVEL = "#level"
+NOT_FOUND = "#not-found"
+SUB_COMPONENTS = "#sub-components"
+
+SCHEMA = """
+CREATE TABLE IF NOT EXISTS snapshot (
+    doc_hash TEXT NOT NULL,
+    cid TEXT NOT NULL,
+    check_name TEXT NOT NULL,
+    value TEXT,
+    PRIMARY KEY (doc_hash, cid, check_name)
+)
+"""
+
+
+def decode_value(check_name, value):
+    if value is None:
+        return None
+    return unpack_value(check_name, json.loads(value))
+
+
+def encode_value(check_name, value) -> str:
+    return json.dumps(pack_value(value))
+
+
+def pack_value(value):
+    return value.to_dict() if isinstance(value, ResultSet) else value
+
+
+def unpack_value(check_name, data):
+    if check_name == SUB_COMPONENTS:
+        return [tuple(id_level) for id_level in data]
+    elif check_name.startswith("#"):
+        return data
+    else:
+        return ResultSet.from_dict(data) if data else None
+
+
+class SnapshotStore:
+    def __init__(self, db_file, salt=""):
+        logging.debug(f"db_file={db_file}")
+        self.db_file = db_file
+        self.salt = f"{SNAPSHOT_VERSION}:{salt}"
+        self.doc_hashes = {}
+        self.local = threading.local()
+        self.hits = 0
+        self.misses = 0
+
+    def _conn(self) -> sqlite3.Connection:
+        # sqlite connections can't be shared between threads or
+        # inherited across a fork, so open one per thread and process.
+        conn = getattr(self.local, "conn", None)
+        if conn is None or self.local.pid != os.getpid():
+            conn = sqlite3.connect(self.db_file, timeout=60)
+            conn.execute("PRAGMA journal_mode=WAL")
+            conn.execute(SCHEMA)
+            self.local.conn = conn
+            self.local.pid = os.getpid()
+        return conn
+
+    def doc_hash(self, doc_file) -> str:
+        if doc_file not in self.doc_hashes:
+            file_hash = util.hash_file(doc_file)
+            self.doc_hashes[doc_file] = util.hash_bytes(
+                f"{self.salt}:{file_hash}".encode()
+            )
+        return self.doc_hashes[doc_file]
+
+    def load(self, doc_file, cid, check_names) -> Dict[str, object]:
+        rows = self._conn().execute(
+            "SELECT check_name, value FROM snapshot"
+            " WHERE doc_hash = ? AND cid = ?",
+            (self.doc_hash(doc_file), cid),
+        )
+        values = {name: decode_value(name, value) for name, value in rows}
+        if NOT_FOUND not in values and any(
+            name not in values for name in check_names
+        ):
+            self.misses += 1
+            return None
+        self.hits += 1
+        return values
+
+    def save(self, doc_file, cid, values) -> None:
+        doc_hash = self.doc_hash(doc_file)
+        with self._conn() as conn:
+            conn.executemany(
+                "INSERT OR REPLACE INTO snapshot VALUES (?, ?, ?, ?)",
+                [
+                    (doc_hash, cid, name, encode_value(name, value))
+                    for name, value in values.items()
+                ],
+            )
@@ -0,0 +1,232 @@
+from concurrent.futures import ThreadPoolExecutor
+from ead_html_validator import archive
+from lxml import etree as ET
+from subprocess import PIPE
+from typing import Dict, Iterator, List, Set
+import ead_html_validator.util as util
+import functools
+import logging
+import os
+import re
+import shutil
+
+# Elements tidy knows about, the rest are reported unless tidyrc declares
+# them with one of the new-*-tags options.
+HTML5_TAGS = set("""
+    a abbr address area article aside audio b base bdi bdo blockquote body br
+    button canvas caption center cite code col colgroup data datalist dd del
+    details dfn dialog div dl dt em embed fieldset figcaption figure font
+    footer form h1 h2 h3 h4 h5 h6 head header hgroup hr html i iframe img
+    input ins kbd label legend li link main map mark math menu meta meter nav
+    noscript object ol optgroup option output p param picture pre progress q
+    rp rt ruby s samp script search section select slot small source span
+    strong style sub summary sup svg table tbody td template textarea tfoot th
+    thead time title tr track u ul var video wbr
+    """.split())
+
+# Older libxml2 flags HTML5 elements as unknown, check_file checks the
+# elements against the ones tidy knows instead.
+IGNORED_ERRORS = {ET.ErrorTypes.HTML_UNKNOWN_TAG}
+
+# Inline SVG and MathML have elements of their own, which aren't checked.
+FOREIGN_TAGS = {"math", "svg"}
+
+DOCTYPE_RE = re.compile(rb"^\s*(<!--.*?-->\s*)*<!doctype", re.I | re.S)
+
+# check_file messages for what tidy only warns about.
+LXML_WARNINGS = (
+    "missing <!DOCTYPE> declaration",
+    "missing <title> element",
+    'lacks "alt" attribute',
+)
+
+
+def check_file(html_file, known_tags) -> List[str]:
+    """
+    Check the structure of an HTML file with the lxml parser error log,
+    covering the problems tidy reports with our tidyrc: mismatched and
+    stray tags, duplicate ids, unknown elements, a missing doctype or
+    title and images without alt text.
+    """
+    with archive.open_input(html_file) as fh:
+        markup = fh.read()
+    parser = ET.HTMLParser(recover=True)
+    try:
+        root = ET.fromstring(markup, parser)
+    except ET.XMLSyntaxError as e:
+        return [str(e)]
+    if root is None:
+        # An empty or blank page parses to nothing.
+        return ["line 1: Document is empty"]
+    messages = [
+        f"line {error.line}: {error.message}"
+        for error in parser.error_log
+        if error.type not in IGNORED_ERRORS
+    ]
+    if not DOCTYPE_RE.match(markup):
+        messages.append("missing <!DOCTYPE> declaration")
+    if root.find("head/title") is None:
+        messages.append("missing <title> element")
+    for elem in html_elements(root):
+        if elem.tag not in known_tags:
+            messages.append(
+                f"line {elem.sourceline}: <{elem.tag}> is not recognized"
+            )
+        elif elem.tag == "img" and elem.get("alt") is None:
+            messages.append(
+                f'line {elem.sourceline}: <img> lacks "alt" attribute'
+            )
+    return messages
+
+
+def check_files(
+    html_files,
+    backend,
+    jobs,
+    tidyrc,
+    cache=None,
+    indent=False,
+    executor=None,
+    inventory=None,
+) -> Dict[str, List[str]]:
+    """
+    Check the HTML files with the lxml backend, in the process pool
+    executor of jobs workers when given, or with at most jobs tidy
+    processes at a time, reusing cached verdicts for files that haven't
+    changed. Returns the problems found per file.
+    """
+    verdicts = {}
+    todo = {}
+    for html_file in html_files:
+        if inventory:
+            stat = list(inventory.stat(html_file))
+        else:
+            st = os.stat(html_file)
+            stat = [st.st_size, st.st_mtime_ns]
+        messages = cache.get(html_file, stat) if cache else None
+        if messages is None or (
+            indent and needs_tidy_copy(html_file, inventory)
+        ):
+            # Only tidy writes the indented copies.
+            todo[html_file] = stat
+        else:
+            verdicts[html_file] = messages
+    logging.debug(
+        f"Checking {len(todo)} HTML files with {backend},"
+        f" {len(verdicts)} cached"
+    )
+
+    chunksize = max(1, len(todo) // (jobs * 4))
+    if backend == "tidy":
+        func = functools.partial(
+            tidy_file, shutil.which("tidy"), tidyrc, indent=indent
+        )
+        with ThreadPoolExecutor(max_workers=jobs) as pool:
+            results = list(pool.map(func, todo))
+    else:
+        func = functools.partial(
+            check_file, known_tags=HTML5_TAGS | read_tidy_tags(tidyrc)
+        )
+        if executor and len(todo) > 1:
+            results = list(executor.map(func, todo, chunksize=chunksize))
+        else:
+            results = list(map(func, todo))
+
+    for html_file, messages in zip(todo, results):
+        verdicts[html_file] = messages
+        if cache:
+            cache.set(html_file, todo[html_file], messages)
+    return verdicts
+
+
+def has_errors(messages, backend) -> bool:
+    # Like tidy, only errors fail a file, warnings are just reported.
+    if backend == "tidy":
+        return any(" - Error: " in message for message in messages)
+    return any(not message.endswith(LXML_WARNINGS) for message in messages)
+
+
+def html_elements(root) -> Iterator[ET._Element]:
+    # The elements in document order, leaving out the insides of foreign
+    # content.
+    stack = [root]
+    while stack:
+        elem = stack.pop()
+        yield elem
+        if elem.tag not in FOREIGN_TAGS:
+            stack.extend(reversed(list(elem.iterchildren(tag=ET.Element))))
+
+
+def needs_tidy_copy(html_file, inventory=None) -> bool:
+    if inventory:
+        return not inventory.exists(tidy_copy(html_file))
+    return not os.path.exists(tidy_copy(html_file))
+
+
+def read_tidy_tags(tidyrc) -> Set[str]:
+    tags = set()
+    with open(tidyrc) as fh:
+        for line in fh:
+            name, sep, value = line.partition(":")
+            if sep and re.fullmatch(r"\s*new-\w+-tags\s*", name):
+                tags.update(tag.strip() for tag in value.split(","))
+    tags.discard("")
+    return tags
+
+
+def tidy_copy(html_file) -> str:
+    return os.path.splitext(html_file)[0] + "-tidy.html"
+
+
+def tidy_file(path_tidy, tidyrc, html_file, indent=False) -> List[str]:
+    if archive.find_member(html_file)[0]:
+        # tidy reads archived pages from stdin, without indented copies.
+        with archive.open_input(html_file, "r") as fh:
+            markup = fh.read()
+        ret = util.do_cmd(
+            [path_tidy, "-config", tidyrc],
+            allowed_returncodes=[1],
+            input=markup,
+            stdout=PIPE,
+            stderr=PIPE,
+        )
+        return ret.stderr.splitlines()
+    ret = util.do_cmd(
+        [path_tidy, "-config", tidyrc, html_file],
+        allowed_returncodes=[1],
+        stdout=PIPE,
+        stderr=PIPE,
+    )
+    if indent and needs_tidy_copy(html_file):
+        with open(tidy_copy(html_file), "w") as wfh:
+            wfh.write(ret.stdout)
+    return ret.stderr.splitlines()
+
+
+class VerdictCache:
+    """
+    Structural check results by file, with the size and modification time
+    the file had, kept between runs. Only the verdicts used in a run are
+    saved.
+    """
+
+    def __init__(self, cache_file):
+        logging.debug(f"cache_file={cache_file}")
+        self.cache_file = cache_file
+        self.entries = util.load_json(cache_file, default={})
+        self.used = {}
+        self.hits = 0
+
+    def get(self, html_file, stat) -> List[str]:
+        entry = self.entries.get(html_file)
+        if not isinstance(entry, list) or entry[:2] != stat:
+            return None
+        self.hits += 1
+        self.used[html_file] = entry
+        return entry[2]
+
+    def save(self) -> None:
+        util.save_json(self.cache_file, self.used)
+
+    def set(self, html_file, stat, messages) -> None:
+        self.used[html_file] = stat + [messages]
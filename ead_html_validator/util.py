@@ -1,7 +1,6 @@
-from bs4 import BeautifulSoup
-from concurrent.futures import ThreadPoolExecutor
 from dateutil.parser import parse, ParserError
 from dateutil.relativedelta import relativedelta
+from ead_html_validator.archive import open_input
 from ead_html_validator.resultset import ResultSet
 from html.entities import codepoint2name
 from lxml import etree as ET
@@ -9,13 +8,14 @@ from subprocess import CalledProcessError, CompletedProcess, run
 from typing import Callable, Dict, List, Tuple
 from urllib.parse import urlparse, urlsplit, urlunsplit
 import csv
+import hashlib
 import inspect
 import json
 import logging
 import os.path
 import re
-import requests
 import string
+import sys
 
 
 class CommandFailedError(Exception):
@@ -80,6 +80,13 @@ def addLoggingLevel(levelName, levelNum, methodName=None) -> None:
     setattr(logging, methodName, logToRoot)
 
 
+def cache_file(cache_dir, kind, *keys, ext=".json") -> str:
+    subdir = os.path.join(cache_dir, kind)
+    os.makedirs(subdir, exist_ok=True)
+    digest = hashlib.sha1("\0".join(map(str, keys)).encode()).hexdigest()
+    return os.path.join(subdir, f"{digest}{ext}")
+
+
 def change_ext(filename, new_ext) -> str:
     basename, ext = os.path.splitext(filename)
     return f"{basename}{new_ext}"
@@ -227,21 +234,6 @@ def encode_named_entities(
     return "".join(new_text_list)
 
 
-def find_broken_links(links) -> List[str]:
-    # Internal function for validating HTTP status code.
-    def _validate_url(url):
-        r = requests.head(url)
-        if r.status_code == 404:
-            broken_links.append(url)
-
-    broken_links = []
-    # Loop through links checking for 404 responses, and append to list.
-    with ThreadPoolExecutor(max_workers=8) as executor:
-        executor.map(_validate_url, links)
-
-    return broken_links
-
-
 def format_duration(duration) -> str:
     attrs = ["years", "months", "days", "hours", "minutes", "seconds"]
     delta = relativedelta(seconds=duration)
@@ -258,31 +250,6 @@ def format_duration(duration) -> str:
     )
 
 
-def get_links(html_file) -> List[str]:
-    soup = BeautifulSoup(open(html_file), "html.parser")
-    link = soup.find("link", rel="canonical")
-    base_url = None
-    if link:
-        url = urlparse(link["href"])
-        base_url = f"{url.scheme}://{url.netloc}"
-
-    links = set()
-    for a in soup.find_all("a"):
-        link = a["href"]
-        if link.startswith("#"):
-            continue
-
-        no_host = link.startswith("/")
-        if no_host and base_url:
-            link = f"{base_url}{link}"
-        elif no_host:
-            continue
-
-        links.add(link)
-
-    return list(links)
-
-
 def get_methods(obj, *includes) -> Dict[str, Callable]:
     methods = {}
 
@@ -331,6 +298,18 @@ def has_newline(text_list) -> bool:
     return any("\n" in text for text in text_list)
 
 
+def hash_bytes(data) -> str:
+    return hashlib.sha256(data).hexdigest()
+
+
+def hash_file(filename, blocksize=1 << 20) -> str:
+    digest = hashlib.sha256()
+    with open_input(filename) as fh:
+        for block in iter(lambda: fh.read(blocksize), b""):
+            digest.update(block)
+    return digest.hexdigest()
+
+
 def is_dlts_handle(url_str) -> bool:
     url = urlparse(url_str)
     return url.netloc == "hdl.handle.net" and re.search(
@@ -351,6 +330,17 @@ def is_url(url) -> bool:
     return urlparse(url).scheme in ["http", "https"] and not url.endswith("\n")
 
 
+def load_json(filename, default=None) -> dict:
+    if not os.path.isfile(filename):
+        return default
+    try:
+        with open(filename) as fh:
+            return json.load(fh)
+    except (OSError, json.JSONDecodeError) as e:
+        logging.warning(f"Ignoring unreadable file {filename}: {e}")
+        return default
+
+
 def parse_level(c) -> Tuple[str, int]:
     level, recursion = c["class"].split()
     level = level.split("-", maxsplit=1)[1]
@@ -384,10 +374,24 @@ def remove_namespace(doc, namespace) ->  None:
                 elem.attrib[attr_name[nsl:]] = elem.attrib.pop(attr_name)
 
 
-def resolve_handle(url) -> str:
-    response = requests.get(url, allow_redirects=False)
-    soup = BeautifulSoup(response.text, "html.parser")
-    return soup.a["href"]
+def rss() -> int:
+    # Current resident set size in bytes, or the peak where /proc isn't
+    # available.
+    try:
+        with open("/proc/self/statm") as fh:
+            return int(fh.read().split()[1]) * os.sysconf("SC_PAGE_SIZE")
+    except OSError:
+        import resource
+
+        maxrss = resource.getrusage(resource.RUSAGE_SELF).ru_maxrss
+        return maxrss if sys.platform == "darwin" else maxrss * 1024
+
+
+def save_json(filename, data) -> None:
+    tmp_file = f"{filename}.{os.getpid()}.tmp"
+    with open(tmp_file, "w") as fh:
+        json.dump(data, fh)
+    os.replace(tmp_file, filename)
 
 
 def sort_dict(mydict) -> dict:
@@ -0,0 +1,89 @@
+#!/bin/bash
+
+# Compare multi-process runtimes with and without worker pinning on the
+# same corpus as runtimes.sh. Each run gets an empty cache directory, and
+# the order of the modes rotates from one collection to the next so that
+# no mode always runs first against a cold page cache.
+
+set -eu
+
+EAD_DIR=$HOME/work/findingaids_eads_test
+
+HTML_ROOT=$HOME/work/scratch/with-do-lookup/public
+
+CMD="$HOME/work/ead-html-validator/ead-html-validator.py"
+
+NOW=$(date +'%Y-%m-%d')
+
+CSV_FILE="validator_pinning_runtimes_${NOW}.csv"
+
+readarray -d '' EAD_FILES < <(find "$EAD_DIR/" -name '*.xml' -print0 \
+	| egrep -vz '(no-ns|pretty).xml$' | sort -z)
+
+ARGS=("" "--pin-workers core" "--pin-workers numa")
+
+echo -n "partner,collection,num components" > $CSV_FILE
+echo -n ",duration unpinned,exit code unpinned" >> $CSV_FILE
+echo -n ",duration pinned to cores,exit code pinned to cores" >> $CSV_FILE
+echo -n ",duration pinned to numa nodes,exit code pinned to numa nodes" \
+	>> $CSV_FILE
+echo >> $CSV_FILE
+
+run()
+{
+	echo "Running command '$@'"
+	set +e
+	"$@"
+	exit_code=$?
+	set -e
+	echo "exit_code=$exit_code"
+}
+
+num_runs=0
+for file in "${EAD_FILES[@]}"
+do
+	tmp=${file#"$EAD_DIR"}
+	tmp=${tmp#/}
+	tmp=${tmp%.xml}
+	partner=${tmp%%/*}
+	collection=${tmp#*/}
+	html_dir="$HTML_ROOT/$partner/$collection/"
+	index_file="${html_dir}index.html"
+	if [ ! -f "$index_file" ]; then
+		echo "$index_file doesn't exist. Skipping $partner/$collection ..."
+		continue
+	fi
+	num_components=$(xmllint --xpath "count(//*[local-name()='c'])" "$file")
+	echo -n "$partner,$collection,$num_components" >> $CSV_FILE
+	durations=()
+	exit_codes=()
+	for j in "${!ARGS[@]}"
+	do
+		i=$(((j + num_runs) % ${#ARGS[@]}))
+		cache_dir=$(mktemp -d)
+		start_time=$(date +%s%N)
+		run $CMD --multiprocessing ${ARGS[$i]} --cache-dir "$cache_dir" \
+			"$@" "$file" "$html_dir"
+		end_time=$(date +%s%N)
+		rm -rf "$cache_dir"
+		duration=$(((end_time - start_time) / 1000000))
+		durations[$i]="$((duration / 1000)).$(printf '%03d' $((duration % 1000)))"
+		exit_codes[$i]=$exit_code
+	done
+	num_runs=$((num_runs + 1))
+	for i in "${!ARGS[@]}"
+	do
+		echo -n ",${durations[$i]},${exit_codes[$i]}" >> $CSV_FILE
+	done
+	echo >> $CSV_FILE
+done
+
+awk -F, 'NR > 1 {
+	n++; unpinned += $4; core += $6; numa += $8
+} END {
+	if (n && unpinned) {
+		printf "Total seconds over %d collections: unpinned %.1f,", n, unpinned
+		printf " cores %.1f (%.2fx), numa %.1f (%.2fx)\n", core,
+			unpinned / core, numa, unpinned / numa
+	}
+}' $CSV_FILE
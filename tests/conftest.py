@@ -0,0 +1,83 @@
+from http.server import ThreadingHTTPServer
+import collections
+import pytest
+import requests
+import socket
+import threading
+
+
+class StubServer(ThreadingHTTPServer):
+    """
+    HTTP server on 127.0.0.1 running in a thread, counting the requests
+    its handler records and how many it handles at a time.
+    """
+
+    daemon_threads = True
+
+    def __init__(self, handler_class):
+        super().__init__(("127.0.0.1", 0), handler_class)
+        self.lock = threading.Lock()
+        self.requests = collections.Counter()
+        self.active = 0
+        self.max_active = 0
+        self.base = f"http://127.0.0.1:{self.server_port}"
+
+    def track(self, key) -> None:
+        with self.lock:
+            self.requests[key] += 1
+            self.active += 1
+            self.max_active = max(self.max_active, self.active)
+
+    def untrack(self) -> None:
+        with self.lock:
+            self.active -= 1
+
+
+@pytest.fixture
+def serve():
+    servers = []
+
+    def start(handler_class) -> StubServer:
+        server = StubServer(handler_class)
+        threading.Thread(target=server.serve_forever, daemon=True).start()
+        servers.append(server)
+        return server
+
+    yield start
+    for server in servers:
+        server.shutdown()
+        server.server_close()
+
+
+@pytest.fixture
+def session():
+    # Keep proxies from the environment out of the way.
+    session = requests.Session()
+    session.trust_env = False
+    yield session
+    session.close()
+
+
+@pytest.fixture
+def make_page(tmp_path):
+    def make(name, markup) -> str:
+        path = tmp_path / name
+        path.parent.mkdir(parents=True, exist_ok=True)
+        path.write_text(markup)
+        return str(path)
+
+    return make
+
+
+@pytest.fixture
+def cache_file(tmp_path) -> str:
+    return str(tmp_path / "cache.json")
+
+
+@pytest.fixture
+def unreachable() -> str:
+    # A port nothing listens on, so connections are refused.
+    with socket.socket() as sock:
+        sock.bind(("127.0.0.1", 0))
+        port = sock.getsockname()[1]
+    return f"http://127.0.0.1:{port}"
@@ -0,0 +1,22 @@
+from ead_html_validator.checkpoint import COMPONENT, Checkpoint
+
+
+def test_sync_in_batches(tmp_path, monkeypatch):
+    synced = []
+    monkeypatch.setattr(
+        "ead_html_validator.checkpoint.os.fsync", lambda fd: synced.append(fd)
+    )
+    journal = str(tmp_path / "journal")
+    checkpoint = Checkpoint(
+        journal, "ead.xml", "html", sync_every=3, sync_interval=60
+    )
+    for cid in ("c1", "c2", "c3", "c4"):
+        checkpoint.add(COMPONENT, cid, [])
+    # The header and the first two records make one batch.
+    assert len(synced) == 1
+    checkpoint.close()
+    assert len(synced) == 2
+
+    resumed = Checkpoint(journal, "ead.xml", "html", resume=True)
+    assert resumed.completed_ids() == ["c1", "c2", "c3", "c4"]
+    resumed.close()
@@ -0,0 +1,114 @@
+from ead_html_validator.handles import HandleResolver
+from http.server import BaseHTTPRequestHandler
+import pytest
+
+
+class Handler(BaseHTTPRequestHandler):
+    # /redirect/* answers with a Location header, /page/* with a page
+    # linking to the target and /gone/* with neither.
+    def do_GET(self):
+        self.server.track(self.path)
+        self.server.untrack()
+        target = f"https://example.org/target{self.path}"
+        if self.path.startswith("/redirect/"):
+            self.send_response(303)
+            self.send_header("Location", target)
+            body = b""
+        elif self.path.startswith("/page/"):
+            self.send_response(200)
+            body = f'<html><body><a href="{target}">here</a>'.encode()
+        else:
+            self.send_response(404)
+            body = b"<html><body>Not found"
+        self.send_header("Content-Length", str(len(body)))
+        self.end_headers()
+        self.wfile.write(body)
+
+    def log_message(self, format, *args):
+        pass
+
+
+def target(path) -> str:
+    return f"https://example.org/target{path}"
+
+
+@pytest.fixture
+def server(serve):
+    return serve(Handler)
+
+
+@pytest.fixture
+def resolver(cache_file, session):
+    resolvers = []
+
+    def make(**kwargs) -> HandleResolver:
+        resolvers.append(HandleResolver(cache_file, session=session, **kwargs))
+        return resolvers[-1]
+
+    yield make
+    for resolver in resolvers:
+        resolver.close()
+
+
+def test_resolve(server, resolver):
+    handles = resolver()
+    url = f"{server.base}/redirect/1"
+    assert handles.resolve(url) == target("/redirect/1")
+    assert handles.resolve(f"{server.base}/page/1") == target("/page/1")
+    handles.resolve(url)
+    assert handles.num_resolved == 2
+    assert server.requests["/redirect/1"] == 1
+
+
+def test_resolve_all(server, resolver, caplog):
+    urls = [f"{server.base}/redirect/{i}" for i in range(10)]
+    urls += [f"{server.base}/page/1", f"{server.base}/gone/1"]
+    targets = resolver(num_threads=4).resolve_all(urls + urls)
+    assert len(targets) == 11
+    assert targets[urls[0]] == target("/redirect/0")
+    assert targets[urls[10]] == target("/page/1")
+    assert urls[11] not in targets
+    assert "/gone/1" in caplog.text
+    # Duplicates are requested once.
+    assert sum(server.requests.values()) == 12
+
+
+def test_cache(server, resolver):
+    urls = [f"{server.base}/redirect/1", f"{server.base}/page/1"]
+    first = resolver()
+    first.resolve_all(urls)
+    first.close()
+
+    second = resolver()
+    targets = second.resolve_all(urls + [f"{server.base}/redirect/2"])
+    assert len(targets) == 3
+    assert second.num_resolved == 1
+    assert server.requests["/redirect/1"] == 1
+
+
+def test_offline(server, resolver):
+    cached = f"{server.base}/redirect/1"
+    online = resolver()
+    online.resolve(cached)
+    online.close()
+
+    offline = resolver(offline=True)
+    uncached = f"{server.base}/redirect/2"
+    assert offline.resolve(cached) == target("/redirect/1")
+    assert offline.resolve(uncached) is None
+    targets = offline.resolve_all([cached, uncached])
+    assert targets == {cached: target("/redirect/1")}
+    assert offline.num_resolved == 0
+    assert sum(server.requests.values()) == 1
+
+
+def test_unreachable(server, resolver, unreachable, caplog):
+    url = f"{unreachable}/redirect/1"
+    handles = resolver(timeout=1)
+    assert handles.resolve_all([url, f"{server.base}/redirect/1"]) == {
+        f"{server.base}/redirect/1": target("/redirect/1")
+    }
+    assert "Can't resolve handle" in caplog.text
+    # Failures aren't cached, the next run tries again.
+    handles.close()
+    assert url not in resolver(offline=True).targets
@@ -0,0 +1,147 @@
+from ead_html_validator.links import (
+    LinkChecker,
+    get_links,
+    harvest_links,
+    is_broken,
+)
+from http.server import BaseHTTPRequestHandler
+import pytest
+import time
+
+
+class Handler(BaseHTTPRequestHandler):
+    # /ok answers everything, /no-head refuses HEAD, /missing is 404,
+    # /busy is 503 and /slow takes a while.
+    def respond(self):
+        self.server.track((self.command, self.path))
+        try:
+            if self.path.startswith("/slow"):
+                time.sleep(0.2)
+            if self.path == "/no-head" and self.command == "HEAD":
+                status = 405
+            elif self.path == "/missing":
+                status = 404
+            elif self.path == "/busy":
+                status = 503
+            else:
+                status = 200
+            body = b"" if self.command == "HEAD" else b"ok"
+            self.send_response(status)
+            self.send_header("Content-Length", str(len(body)))
+            self.end_headers()
+            self.wfile.write(body)
+        finally:
+            self.server.untrack()
+
+    do_GET = do_HEAD = respond
+
+    def log_message(self, format, *args):
+        pass
+
+
+@pytest.fixture
+def server(serve):
+    return serve(Handler)
+
+
+@pytest.fixture
+def checker(cache_file, session):
+    checkers = []
+
+    def make(**kwargs) -> LinkChecker:
+        checkers.append(LinkChecker(cache_file, session=session, **kwargs))
+        return checkers[-1]
+
+    yield make
+    for checker in checkers:
+        checker.close()
+
+
+def test_head_falls_back_to_get(server, checker):
+    results = checker().check([f"{server.base}/no-head", f"{server.base}/ok"])
+    assert results[f"{server.base}/no-head"]["status"] == 200
+    assert results[f"{server.base}/ok"]["status"] == 200
+    assert server.requests["HEAD", "/no-head"] == 1
+    assert server.requests["GET", "/no-head"] == 1
+    assert server.requests["GET", "/ok"] == 0
+
+
+def test_host_limit(server, checker):
+    urls = [f"{server.base}/slow/{i}" for i in range(8)]
+    results = checker(host_limit=2, num_threads=8).check(urls)
+    assert all(result["status"] == 200 for result in results.values())
+    assert server.max_active == 2
+
+
+def test_host_rate(server, checker):
+    urls = [f"{server.base}/ok/{i}" for i in range(5)]
+    start = time.monotonic()
+    checker(host_rate=10).check(urls)
+    assert time.monotonic() - start >= 0.4
+
+
+def test_timeout(server, checker):
+    url = f"{server.base}/slow"
+    result = checker(timeout=0.05).check([url])[url]
+    assert result["status"] is None
+    assert "Timeout" in result["error"]
+    assert is_broken(result)
+
+
+def test_transient_statuses_are_retried(server, checker):
+    urls = [f"{server.base}/missing", f"{server.base}/busy"]
+    first = checker()
+    results = first.check(urls)
+    first.close()
+    assert is_broken(results[f"{server.base}/missing"])
+
+    # The 404 comes from the cache, the 503 is requested again.
+    second = checker()
+    results = second.check(urls)
+    assert second.hits == 1
+    assert results[f"{server.base}/busy"]["status"] == 503
+    assert server.requests["HEAD", "/missing"] == 1
+    assert server.requests["HEAD", "/busy"] == 2
+
+
+def test_expired_entries_are_checked_again(server, checker):
+    url = f"{server.base}/ok"
+    expired = checker(ttl=0)
+    expired.check([url])
+    expired.check([url])
+    assert expired.hits == 0
+    assert server.requests["HEAD", "/ok"] == 2
+
+
+def test_unreachable(checker, unreachable):
+    url = f"{unreachable}/ok"
+    unreachable_checker = checker(timeout=1)
+    result = unreachable_checker.check([url])[url]
+    assert "ConnectionError" in result["error"]
+    assert is_broken(result)
+    # Errors aren't cached, the next run tries again.
+    assert url not in unreachable_checker.entries
+
+
+def test_empty_page(make_page, caplog):
+    assert get_links(make_page("index.html", "")) == []
+    assert "Can't parse" in caplog.text
+    assert get_links(make_page("blank/index.html", " \n")) == []
+
+
+def test_harvest_links(make_page):
+    page = make_page(
+        "index.html",
+        """<html><head>
+        <link rel="canonical" href="https://example.org/fa/">
+        </head><body>
+        <a href="https://example.com/a">a</a>
+        <a href="/fa/b">b</a>
+        <a href="#top">top</a>
+        </body></html>""",
+    )
+    empty = make_page("empty/index.html", "")
+    assert harvest_links([page, empty]) == {
+        "https://example.com/a": {page},
+        "https://example.org/fa/b": {page},
+    }
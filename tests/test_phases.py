@@ -0,0 +1,39 @@
+from ead_html_validator.phases import PhaseGraph
+
+
+def test_priority():
+    order = []
+    phases = PhaseGraph(1)
+    phases.add("background", lambda: order.append("background"), priority=-1)
+    phases.add("parse", lambda: order.append("parse"))
+    phases.add("check", lambda: order.append("check"), deps=["parse"])
+    phases.start()
+    assert phases.join() == {}
+    # check became ready after background, but goes first.
+    assert order == ["parse", "check", "background"]
+
+
+def test_join_returns_failures():
+    def fail():
+        raise ValueError("bad page")
+
+    phases = PhaseGraph(2)
+    phases.add("tidy", fail)
+    phases.add("report", lambda: "report", deps=["tidy"])
+    phases.add("parse", lambda: "parsed")
+    phases.start()
+    failures = phases.join()
+    assert sorted(failures) == ["report", "tidy"]
+    assert isinstance(failures["tidy"], ValueError)
+    assert phases.result("parse") == "parsed"
+
+
+def test_when_done():
+    done = []
+    phases = PhaseGraph(2)
+    phases.add("tidy", lambda: None)
+    phases.add("links", lambda: None)
+    phases.when_done(["tidy", "links"], lambda: done.append(True))
+    phases.start()
+    phases.join()
+    assert done == [True]
@@ -0,0 +1,129 @@
+from concurrent.futures import Future, ThreadPoolExecutor
+from concurrent.futures.process import BrokenProcessPool
+from ead_html_validator.pool import MAX_TASK_RETRIES, TaskPool
+import time
+
+
+def check_chunk(chunk):
+    now = time.time()
+    stats = {"pid": 1, "warmup": 0.0, "rss": 0, "tasks": 1}
+    return [(cid, True, [cid]) for cid, _, _ in chunk], now, now, stats
+
+
+def make_chunks(*cids):
+    return [[(cid, "", ())] for cid in cids]
+
+
+class Executors:
+    # Thread pools that count the generations, chunks listed in broken
+    # fail as if their worker process died.
+    def __init__(self, broken=()):
+        self.broken = set(broken)
+        self.generations = 0
+        self.submitted = []
+
+    def make(self) -> ThreadPoolExecutor:
+        self.generations += 1
+        return ThreadPoolExecutor(max_workers=2)
+
+    def submit(self, chunks):
+        def submit(executor, i, upcoming) -> Future:
+            self.submitted.append(i)
+            if i in self.broken:
+                future = Future()
+                future.set_exception(BrokenProcessPool("worker died"))
+                return future
+            return executor.submit(check_chunk, chunks[i])
+
+        return submit
+
+
+def run_pool(executors, chunks, **kwargs):
+    results = {}
+
+    def on_results(i, chunk_results) -> bool:
+        results[i] = chunk_results
+        return False
+
+    pool = TaskPool(
+        chunks, executors.submit(chunks), executors.make, 2, **kwargs
+    )
+    assert not pool.run(on_results)
+    return pool, results
+
+
+def test_runs_all_chunks():
+    executors = Executors()
+    chunks = make_chunks("c1", "c2", "c3", "c4", "c5")
+    pool, results = run_pool(executors, chunks)
+    assert sorted(results) == [0, 1, 2, 3, 4]
+    assert results[2] == [("c3", True, ["c3"])]
+    assert pool.num_done == 5
+    assert executors.generations == 1
+
+
+def test_retries_broken_chunk():
+    executors = Executors(broken={1})
+    chunks = make_chunks("c1", "c2", "c3")
+    pool, results = run_pool(executors, chunks)
+    # Retried on each new generation until it runs out of attempts.
+    assert executors.submitted.count(1) == MAX_TASK_RETRIES + 1
+    assert results[1] == [("c2", False, "BrokenProcessPool('worker died')")]
+    assert results[0] == [("c1", True, ["c1"])]
+    assert results[2] == [("c3", True, ["c3"])]
+
+
+def test_gives_up_on_barren_generations():
+    executors = Executors(broken={0, 1})
+    in_flight = [0, 0]
+    pool, results = run_pool(
+        executors, make_chunks("c1", "c2"), in_flight=in_flight
+    )
+    # The chunks were never flagged as running, so they're only given up
+    # on once generation after generation finished nothing.
+    assert executors.generations == MAX_TASK_RETRIES + 1
+    assert results[0] == [("c1", False, "worker processes died")]
+    assert pool.num_done == 0
+
+
+def test_recycles_workers():
+    executors = Executors()
+    chunks = make_chunks("c1", "c2", "c3", "c4")
+    pool, results = run_pool(
+        executors, chunks, check_worker=lambda stats: "worker is old"
+    )
+    assert len(results) == 4
+    assert executors.generations > 1
+
+
+def test_stops():
+    executors = Executors()
+    chunks = make_chunks("c1", "c2", "c3", "c4", "c5", "c6")
+    seen = []
+
+    def on_results(i, chunk_results) -> bool:
+        seen.append(i)
+        return True
+
+    pool = TaskPool(chunks, executors.submit(chunks), executors.make, 2)
+    assert pool.run(on_results)
+    assert len(seen) == 1
+    assert len(executors.submitted) < len(chunks)
+
+
+def test_handles_side_tasks():
+    executors = Executors()
+    chunks = make_chunks("c1")
+    finished = Future()
+    finished.set_result(None)
+    side = {finished: "nesting"}
+    done = []
+
+    def on_side(name, future) -> bool:
+        done.append(name)
+        return False
+
+    pool = TaskPool(chunks, executors.submit(chunks), executors.make, 2)
+    assert not pool.run(lambda i, results: False, side=side, on_side=on_side)
+    assert done == ["nesting"]
+    assert side == {}
@@ -0,0 +1,72 @@
+from ead_html_validator.structure import (
+    HTML5_TAGS,
+    VerdictCache,
+    check_file,
+    check_files,
+    has_errors,
+)
+import os
+import pytest
+
+TIDYRC = os.path.join(os.path.dirname(__file__), "..", "tidyrc")
+
+VALID_PAGE = """<!DOCTYPE html>
+<html>
+<head><title>Collection</title></head>
+<body><p>Some <b>text</b></p><img src="a.png" alt=""></body>
+</html>
+"""
+
+
+def test_valid_page(make_page):
+    assert check_file(make_page("index.html", VALID_PAGE), HTML5_TAGS) == []
+
+
+@pytest.mark.parametrize("markup", ["", " \n\t\n"])
+def test_empty_page(make_page, markup):
+    messages = check_file(make_page("index.html", markup), HTML5_TAGS)
+    assert messages == ["line 1: Document is empty"]
+    assert has_errors(messages, "lxml")
+
+
+def test_warnings_only(make_page):
+    markup = "<html><body><img src='a.png'></body></html>"
+    messages = check_file(make_page("index.html", markup), HTML5_TAGS)
+    assert len(messages) == 3
+    assert not has_errors(messages, "lxml")
+
+
+def test_check_files(make_page):
+    empty = make_page("empty/index.html", "")
+    valid = make_page("valid/index.html", VALID_PAGE)
+    verdicts = check_files([empty, valid], "lxml", 1, TIDYRC)
+    assert verdicts == {empty: ["line 1: Document is empty"], valid: []}
+
+
+def test_foreign_content(make_page):
+    markup = VALID_PAGE.replace(
+        "<p>",
+        """<svg viewBox="0 0 10 10"><title>Icon</title>
+        <g><path d="M0 0"/><circle r="1"/><use href="#a"/></g></svg>
+        <math><mi>x</mi></math><blink>old</blink><p>""",
+    )
+    messages = check_file(make_page("index.html", markup), HTML5_TAGS)
+    assert messages == ["line 6: <blink> is not recognized"]
+
+
+def test_verdict_cache(make_page, cache_file):
+    page = make_page("index.html", VALID_PAGE)
+    cache = VerdictCache(cache_file)
+    check_files([page], "lxml", 1, TIDYRC, cache=cache)
+    cache.save()
+
+    cache = VerdictCache(cache_file)
+    assert check_files([page], "lxml", 1, TIDYRC, cache=cache) == {page: []}
+    assert cache.hits == 1
+
+    # A page that changed size is checked again.
+    make_page("index.html", "")
+    cache = VerdictCache(cache_file)
+    verdicts = check_files([page], "lxml", 1, TIDYRC, cache=cache)
+    assert verdicts == {page: ["line 1: Document is empty"]}
+    assert cache.hits == 0